@@ -0,0 +1,28 @@
+"""chat summary watermark
+
+Revision ID: 3f1c2a9d7b40
+Revises: eebcff1b84f8
+Create Date: 2026-10-17 09:12:04.118532
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c2a9d7b40'
+down_revision: Union[str, Sequence[str], None] = 'eebcff1b84f8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('chats', sa.Column('summarized_until_id', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('chats', 'summarized_until_id')
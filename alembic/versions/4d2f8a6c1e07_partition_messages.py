@@ -0,0 +1,129 @@
+"""partition messages by id range
+
+Revision ID: 4d2f8a6c1e07
+Revises: 9b3d57e0a1f4
+Create Date: 2026-10-17 16:21:09.553817
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4d2f8a6c1e07'
+down_revision: Union[str, Sequence[str], None] = '9b3d57e0a1f4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Ids per partition, and partitions created ahead of the id sequence; the
+# worker keeps extending them (MESSAGE_PARTITION_ROWS, ..._AHEAD).
+PARTITION_ROWS = 10_000_000
+PARTITIONS_AHEAD = 2
+
+INDEXES = [
+    ('ix_messages_chat_id', ['chat_id']),
+    ('ix_messages_chatid_created', ['chat_id', 'created_at']),
+    ('ix_messages_created_at', ['created_at']),
+    ('ix_messages_is_deleted', ['is_deleted']),
+    ('ix_messages_parent_id', ['parent_id']),
+]
+
+COLUMNS = (
+    'id, chat_id, sender, content_preview, content, created_at, is_deleted, '
+    'parent_id, path, depth, status, completion_tokens, images'
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Partitioned by id, which every hot lookup (a reply's appends, a
+    # branch's ancestors, ownership checks) filters on, so each one prunes
+    # to a single partition. Ids follow insertion order, so old ranges are
+    # old data and can be detached once compacted.
+    #
+    # The existing table is not copied: it becomes the partition holding
+    # every id issued so far, and new ids go to the ranges after it.
+    last_id = op.get_bind().execute(
+        sa.text("SELECT last_value FROM messages_id_seq")
+    ).scalar()
+    boundary = (last_id // PARTITION_ROWS + 1) * PARTITION_ROWS
+
+    op.execute("ALTER TABLE messages RENAME TO messages_legacy")
+    op.execute("ALTER TABLE messages_legacy RENAME CONSTRAINT messages_pkey TO messages_legacy_pkey")
+    for name, _ in INDEXES:
+        op.execute(f"ALTER INDEX {name} RENAME TO {name}_legacy")
+    # Compaction clears dangling parents in batches instead.
+    op.drop_constraint('fk_messages_parent_id', 'messages_legacy', type_='foreignkey')
+
+    op.create_table('messages',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('messages_id_seq'::regclass)"), nullable=False),
+    sa.Column('chat_id', sa.Integer(), nullable=False),
+    sa.Column('sender', postgresql.ENUM('user', 'assistant', 'system', name='senderrole', create_type=False), nullable=False),
+    sa.Column('content_preview', sa.String(length=500), nullable=True),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('is_deleted', sa.Boolean(), nullable=False),
+    sa.Column('parent_id', sa.Integer(), nullable=True),
+    sa.Column('path', sa.ARRAY(sa.Integer()), server_default=sa.text("'{}'"), nullable=False),
+    sa.Column('depth', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('status', postgresql.ENUM('in_progress', 'complete', 'partial', 'cancelled', name='messagestatus', create_type=False), server_default='complete', nullable=False),
+    sa.Column('completion_tokens', sa.Integer(), nullable=True),
+    sa.Column('images', sa.ARRAY(sa.String(length=64)), server_default=sa.text("'{}'"), nullable=False),
+    sa.ForeignKeyConstraint(['chat_id'], ['chats.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id', name='messages_pkey'),
+    postgresql_partition_by='RANGE (id)'
+    )
+    op.execute("ALTER SEQUENCE messages_id_seq OWNED BY messages.id")
+
+    # The legacy primary key already is the unique index on the partition
+    # key, so ATTACH adopts it instead of building one. With a validated
+    # CHECK matching the bound it also skips its own scan; VALIDATE only
+    # takes a SHARE UPDATE EXCLUSIVE lock, so writes continue meanwhile.
+    op.execute(
+        f"ALTER TABLE messages_legacy ADD CONSTRAINT messages_legacy_bound "
+        f"CHECK (id < {boundary}) NOT VALID"
+    )
+    op.execute("ALTER TABLE messages_legacy VALIDATE CONSTRAINT messages_legacy_bound")
+    op.execute(
+        f"ALTER TABLE messages ATTACH PARTITION messages_legacy "
+        f"FOR VALUES FROM (MINVALUE) TO ({boundary})"
+    )
+    op.drop_constraint('messages_legacy_bound', 'messages_legacy', type_='check')
+
+    for i in range(PARTITIONS_AHEAD):
+        start = boundary + i * PARTITION_ROWS
+        op.execute(
+            f"CREATE TABLE messages_id_{start} PARTITION OF messages "
+            f"FOR VALUES FROM ({start}) TO ({start + PARTITION_ROWS})"
+        )
+    op.execute("CREATE TABLE messages_default PARTITION OF messages DEFAULT")
+
+    # Matching indexes already on messages_legacy are attached, not rebuilt.
+    for name, columns in INDEXES:
+        op.create_index(name, 'messages', columns, unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("ALTER TABLE messages DETACH PARTITION messages_legacy")
+    op.execute("ALTER SEQUENCE messages_id_seq OWNED BY messages_legacy.id")
+    op.execute(
+        f"INSERT INTO messages_legacy ({COLUMNS}) SELECT {COLUMNS} FROM messages"
+    )
+    op.drop_table('messages')
+
+    op.execute("ALTER TABLE messages_legacy RENAME TO messages")
+    op.execute("ALTER TABLE messages RENAME CONSTRAINT messages_legacy_pkey TO messages_pkey")
+    for name, _ in INDEXES:
+        op.execute(f"ALTER INDEX {name}_legacy RENAME TO {name}")
+
+    # Parents may have been purged while there was no foreign key.
+    op.execute("""
+        UPDATE messages SET parent_id = NULL
+        WHERE parent_id IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM messages p WHERE p.id = messages.parent_id)
+    """)
+    op.create_foreign_key('fk_messages_parent_id', 'messages', 'messages', ['parent_id'], ['id'], ondelete='SET NULL')
@@ -0,0 +1,45 @@
+"""summaries per branch
+
+Revision ID: 5b9c2e7f4a10
+Revises: a6e3f09d2c58
+Create Date: 2026-10-17 21:36:12.418305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b9c2e7f4a10'
+down_revision: Union[str, Sequence[str], None] = 'a6e3f09d2c58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('branch_summaries',
+    sa.Column('message_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('chat_id', sa.Integer(), nullable=False),
+    sa.Column('summary', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['chat_id'], ['chats.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('message_id')
+    )
+    op.create_index(op.f('ix_branch_summaries_chat_id'), 'branch_summaries', ['chat_id'], unique=False)
+    # Existing chat summaries become the summary of the branch they ended
+    # on; other branches get theirs when they are next continued.
+    op.execute("""
+        INSERT INTO branch_summaries (message_id, chat_id, summary)
+        SELECT summarized_until_id, id, summary FROM chats
+        WHERE summarized_until_id IS NOT NULL AND summary IS NOT NULL
+        ON CONFLICT DO NOTHING
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_branch_summaries_chat_id'), table_name='branch_summaries')
+    op.drop_table('branch_summaries')
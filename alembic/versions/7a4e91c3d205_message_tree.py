@@ -0,0 +1,55 @@
+"""message tree
+
+Revision ID: 7a4e91c3d205
+Revises: 3f1c2a9d7b40
+Create Date: 2026-10-17 10:03:51.402177
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a4e91c3d205'
+down_revision: Union[str, Sequence[str], None] = '3f1c2a9d7b40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('messages', sa.Column('parent_id', sa.Integer(), nullable=True))
+    op.add_column('messages', sa.Column('path', sa.ARRAY(sa.Integer()), server_default=sa.text("'{}'"), nullable=False))
+    op.add_column('messages', sa.Column('depth', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.create_foreign_key('fk_messages_parent_id', 'messages', 'messages', ['parent_id'], ['id'], ondelete='SET NULL')
+    op.create_index(op.f('ix_messages_parent_id'), 'messages', ['parent_id'], unique=False)
+
+    # Existing chats are linear: chain every message to the one before it.
+    op.execute("""
+        UPDATE messages m
+        SET parent_id = o.prev_id, path = o.path, depth = o.depth
+        FROM (
+            SELECT
+                id,
+                lag(id) OVER w AS prev_id,
+                coalesce(
+                    array_agg(id) OVER (w ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING),
+                    '{}'::integer[]
+                ) AS path,
+                row_number() OVER w - 1 AS depth
+            FROM messages
+            WINDOW w AS (PARTITION BY chat_id ORDER BY created_at, id)
+        ) o
+        WHERE m.id = o.id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_messages_parent_id'), table_name='messages')
+    op.drop_constraint('fk_messages_parent_id', 'messages', type_='foreignkey')
+    op.drop_column('messages', 'depth')
+    op.drop_column('messages', 'path')
+    op.drop_column('messages', 'parent_id')
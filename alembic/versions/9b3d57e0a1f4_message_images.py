@@ -0,0 +1,28 @@
+"""message images
+
+Revision ID: 9b3d57e0a1f4
+Revises: e81b07f4c2d6
+Create Date: 2026-10-17 15:02:37.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b3d57e0a1f4'
+down_revision: Union[str, Sequence[str], None] = 'e81b07f4c2d6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('messages', sa.Column('images', sa.ARRAY(sa.String(length=64)), server_default=sa.text("'{}'"), nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('messages', 'images')
@@ -0,0 +1,42 @@
+"""index message search by user
+
+Revision ID: a6e3f09d2c58
+Revises: c8d1e5a7b392
+Create Date: 2026-10-17 20:14:37.602981
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6e3f09d2c58'
+down_revision: Union[str, Sequence[str], None] = 'c8d1e5a7b392'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+    op.add_column('messages', sa.Column('user_id', sa.Integer(), nullable=True))
+    # The backfill writes a new version of every row, and Postgres recomputes
+    # the stored search_vector with it, so this costs about as much as the
+    # rewrite f3a8b1d62e95 did when it added that column. Run it in a
+    # maintenance window and VACUUM messages afterwards.
+    op.execute("""
+        UPDATE messages SET user_id = chats.user_id
+        FROM chats WHERE chats.id = messages.chat_id
+    """)
+    op.alter_column('messages', 'user_id', nullable=False)
+    op.create_index('ix_messages_user_search', 'messages', ['user_id', 'search_vector'], unique=False, postgresql_using='gin')
+    op.drop_index('ix_messages_search_vector', table_name='messages', postgresql_using='gin')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index('ix_messages_search_vector', 'messages', ['search_vector'], unique=False, postgresql_using='gin')
+    op.drop_index('ix_messages_user_search', table_name='messages', postgresql_using='gin')
+    op.drop_column('messages', 'user_id')
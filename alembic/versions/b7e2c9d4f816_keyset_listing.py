@@ -0,0 +1,30 @@
+"""keyset listing
+
+Revision ID: b7e2c9d4f816
+Revises: 4d2f8a6c1e07
+Create Date: 2026-10-17 17:05:44.290163
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e2c9d4f816'
+down_revision: Union[str, Sequence[str], None] = '4d2f8a6c1e07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_chats_user_updated', 'chats', ['user_id', sa.text('updated_at DESC'), sa.text('id DESC')], unique=False, postgresql_where=sa.text('is_deleted = false'))
+    # Previews were never written before; the listing API returns them.
+    op.execute("UPDATE messages SET content_preview = left(content, 500) WHERE content_preview IS NULL")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_chats_user_updated', table_name='chats', postgresql_where=sa.text('is_deleted = false'))
@@ -0,0 +1,32 @@
+"""message status
+
+Revision ID: c52d8e1f6a93
+Revises: 7a4e91c3d205
+Create Date: 2026-10-17 11:26:40.775019
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c52d8e1f6a93'
+down_revision: Union[str, Sequence[str], None] = '7a4e91c3d205'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+message_status = sa.Enum('in_progress', 'complete', 'partial', name='messagestatus')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    message_status.create(op.get_bind(), checkfirst=True)
+    op.add_column('messages', sa.Column('status', message_status, server_default='complete', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('messages', 'status')
+    message_status.drop(op.get_bind(), checkfirst=True)
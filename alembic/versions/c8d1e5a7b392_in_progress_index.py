@@ -0,0 +1,28 @@
+"""index replies still in progress
+
+Revision ID: c8d1e5a7b392
+Revises: f3a8b1d62e95
+Create Date: 2026-10-17 19:02:41.208734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c8d1e5a7b392'
+down_revision: Union[str, Sequence[str], None] = 'f3a8b1d62e95'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_messages_in_progress', 'messages', ['created_at'], unique=False, postgresql_where=sa.text("status = 'in_progress'::messagestatus"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_messages_in_progress', table_name='messages', postgresql_where=sa.text("status = 'in_progress'::messagestatus"))
@@ -0,0 +1,32 @@
+"""generation cancellation
+
+Revision ID: e81b07f4c2d6
+Revises: c52d8e1f6a93
+Create Date: 2026-10-17 13:48:12.630914
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e81b07f4c2d6'
+down_revision: Union[str, Sequence[str], None] = 'c52d8e1f6a93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE messagestatus ADD VALUE IF NOT EXISTS 'cancelled'")
+    op.add_column('messages', sa.Column('completion_tokens', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('messages', 'completion_tokens')
+    # Postgres cannot drop a value from an enum type; fold it into 'partial'.
+    op.execute("UPDATE messages SET status = 'partial' WHERE status = 'cancelled'")
@@ -0,0 +1,31 @@
+"""message search
+
+Revision ID: f3a8b1d62e95
+Revises: b7e2c9d4f816
+Create Date: 2026-10-17 17:48:20.731552
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a8b1d62e95'
+down_revision: Union[str, Sequence[str], None] = 'b7e2c9d4f816'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('messages', sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed("CASE WHEN status <> 'in_progress'::messagestatus THEN to_tsvector('english'::regconfig, content) END", persisted=True), nullable=True))
+    op.create_index('ix_messages_search_vector', 'messages', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_messages_search_vector', table_name='messages', postgresql_using='gin')
+    op.drop_column('messages', 'search_vector')
@@ -0,0 +1,260 @@
+"""Async load generator for /chat/send.
+
+Replays prompts from a JSONL file (or synthetic ones) at one or more
+concurrency levels and writes a JSON report, e.g.
+
+    python -m benchmarks.loadgen --url http://localhost:3001 \\
+        --prompts requests.jsonl --concurrency 1,8,32 --turns 4
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import subprocess
+import time
+import uuid
+
+import httpx
+import orjson
+
+
+def load_prompts(path: str | None) -> list[str]:
+    if not path:
+        return [f"Explain topic {i} in a few sentences." for i in range(100)]
+
+    prompts = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            text = row.get("message") or row.get("body") or row.get("title")
+            if text:
+                prompts.append(text)
+    return prompts
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def pick(q):
+        return round(values[min(len(values) - 1, int(q * len(values)))], 2)
+
+    return {
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p99": pick(0.99),
+        "max": round(values[-1], 2),
+        "mean": round(sum(values) / len(values), 2),
+    }
+
+
+def server_timing(header: str | None, name: str) -> float | None:
+    for part in (header or "").split(","):
+        metric, *params = [p.strip() for p in part.split(";")]
+        if metric != name:
+            continue
+        for param in params:
+            if param.startswith("dur="):
+                return float(param[4:])
+    return None
+
+
+async def authenticate(client: httpx.AsyncClient, email: str, password: str) -> str:
+    credentials = {"email": email, "password": password}
+    r = await client.post("/auth/signin", json=credentials)
+    if r.status_code == 401:
+        r = await client.post("/auth/signup", json=credentials)
+    r.raise_for_status()
+    return r.json()["access_token"]
+
+
+async def completion_tokens(client, headers, message_ids) -> int | None:
+    # The API stores the upstream's usage count with each reply; frames
+    # are not tokens once coalescing merges them.
+    total = 0
+    for message_id in message_ids:
+        r = await client.get(f"/chat/message/{message_id}", headers=headers)
+        if r.status_code != 200 or r.json().get("completion_tokens") is None:
+            return None
+        total += r.json()["completion_tokens"]
+    return total
+
+
+async def send_turn(client, headers, body, sample):
+    started = time.perf_counter()
+    first_token = None
+    frames = 0
+    message_ids = []
+
+    async with client.stream("POST", "/chat/send", json=body, headers=headers) as r:
+        sample["status"] = r.status_code
+        if r.status_code != 200:
+            await r.aread()
+            return None
+        sample["db_ms"] = server_timing(r.headers.get("server-timing"), "db")
+
+        chat_id = None
+        async for line in r.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = orjson.loads(line[5:])
+            if "chat_id" in data:
+                chat_id = data["chat_id"]
+                message_ids.append(data["message_id"])
+            elif "token" in data:
+                if first_token is None:
+                    first_token = time.perf_counter()
+                frames += 1
+            elif "done" in data:
+                sample["outcome"] = data["done"]
+
+    ended = time.perf_counter()
+    sample["e2e_ms"] = (ended - started) * 1000
+    sample["frames"] = frames
+    sample["tokens"] = await completion_tokens(client, headers, message_ids)
+    if first_token is not None:
+        sample["ttft_ms"] = (first_token - started) * 1000
+        if ended > first_token:
+            sample["frames_per_s"] = frames / (ended - first_token)
+            if sample["tokens"] is not None:
+                sample["tokens_per_s"] = sample["tokens"] / (ended - first_token)
+    return chat_id
+
+
+async def conversation(client, headers, prompts, turns, coalesce_ms, n, samples):
+    chat_id = None
+    for turn in range(turns):
+        body = {"message": random.choice(prompts), "n": n}
+        if chat_id is None:
+            body["new_chat"] = True
+        else:
+            body["chat_id"] = chat_id
+        if coalesce_ms is not None:
+            body["coalesce_ms"] = coalesce_ms
+
+        sample = {"turn": turn}
+        samples.append(sample)
+        try:
+            chat_id = await send_turn(client, headers, body, sample) or chat_id
+        except httpx.HTTPError as e:
+            sample["error"] = type(e).__name__
+            return
+
+
+async def run_level(args, client, headers, prompts, concurrency):
+    samples: list[dict] = []
+    started = time.perf_counter()
+    pending = args.conversations
+    while pending > 0:
+        batch = min(pending, concurrency)
+        await asyncio.gather(
+            *(
+                conversation(
+                    client,
+                    headers,
+                    prompts,
+                    args.turns,
+                    args.coalesce_ms,
+                    args.n,
+                    samples,
+                )
+                for _ in range(batch)
+            )
+        )
+        pending -= batch
+    elapsed = time.perf_counter() - started
+
+    ok = [s for s in samples if s.get("status") == 200 and "error" not in s]
+    frames = sum(s.get("frames", 0) for s in ok)
+    tokens = sum(s.get("tokens") or 0 for s in ok)
+    return {
+        "concurrency": concurrency,
+        "turns": len(samples),
+        "ok": len(ok),
+        "rejected": sum(1 for s in samples if s.get("status") == 429),
+        "errors": sum(
+            1 for s in samples if "error" in s or s.get("status") not in (200, 429)
+        ),
+        "duration_s": round(elapsed, 2),
+        "ttft_ms": percentiles([s["ttft_ms"] for s in ok if "ttft_ms" in s]),
+        "e2e_ms": percentiles([s["e2e_ms"] for s in ok if "e2e_ms" in s]),
+        "db_ms": percentiles([s["db_ms"] for s in ok if s.get("db_ms") is not None]),
+        "tokens_per_s_per_stream": percentiles(
+            [s["tokens_per_s"] for s in ok if "tokens_per_s" in s]
+        ),
+        "aggregate_tokens_per_s": round(tokens / elapsed, 1) if elapsed else 0,
+        "frames_per_s_per_stream": percentiles(
+            [s["frames_per_s"] for s in ok if "frames_per_s" in s]
+        ),
+        "aggregate_frames_per_s": round(frames / elapsed, 1) if elapsed else 0,
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args):
+    prompts = load_prompts(args.prompts)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    timeout = httpx.Timeout(args.timeout, connect=10)
+    async with httpx.AsyncClient(
+        base_url=args.url, limits=limits, timeout=timeout
+    ) as client:
+        token = await authenticate(client, args.email, args.password)
+        headers = {"Authorization": f"Bearer {token}"}
+
+        levels = []
+        for concurrency in args.concurrency:
+            result = await run_level(args, client, headers, prompts, concurrency)
+            levels.append(result)
+            print(json.dumps(result))
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "url": args.url,
+        "prompts": args.prompts or "synthetic",
+        "turns_per_conversation": args.turns,
+        "coalesce_ms": args.coalesce_ms,
+        "n": args.n,
+        "levels": levels,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:3001")
+    parser.add_argument("--prompts", help="JSONL with message/body/title fields")
+    parser.add_argument(
+        "--concurrency",
+        type=lambda v: [int(c) for c in v.split(",")],
+        default=[1, 8, 32],
+    )
+    parser.add_argument("--conversations", type=int, default=32, help="per level")
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--coalesce-ms", type=int)
+    parser.add_argument("--n", type=int, default=1, help="alternatives per turn")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--email", default=f"bench-{uuid.uuid4().hex[:8]}@example.com")
+    parser.add_argument("--password", default="bench-password")
+    parser.add_argument("--output", default="bench_results.json")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Mock OpenAI-compatible vLLM server for measuring the API's own overhead.
+
+    python -m benchmarks.mock_vllm --port 8000 --ttft-ms 150 --itl-ms 20 --tokens 200
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+import orjson
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI()
+app.state.ttft = 0.15
+app.state.itl = 0.02
+app.state.tokens = 200
+app.state.jitter = 0.0
+app.state.active = 0
+app.state.served = 0
+
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod".split()
+
+
+def sleep_for(base: float) -> float:
+    jitter = app.state.jitter
+    return max(0.0, base * (1 + random.uniform(-jitter, jitter)))
+
+
+def chunk(
+    completion_id: str, model: str, delta: dict, finish_reason=None, index: int = 0
+) -> bytes:
+    payload = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": index, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
+
+def usage_chunk(completion_id: str, model: str, completion_tokens: int) -> bytes:
+    payload = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [],
+        "usage": {"completion_tokens": completion_tokens},
+    }
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
+
+async def stream_reply(
+    request: Request,
+    completion_id: str,
+    model: str,
+    tokens: int,
+    n: int,
+    include_usage: bool,
+):
+    # With n > 1 the choices advance together, one chunk per choice per
+    # step, the way vLLM interleaves the sequences of one request.
+    app.state.active += 1
+    try:
+        for index in range(n):
+            yield chunk(completion_id, model, {"role": "assistant"}, index=index)
+        await asyncio.sleep(sleep_for(app.state.ttft))
+        for i in range(tokens):
+            if await request.is_disconnected():
+                return
+            for index in range(n):
+                delta = {"content": random.choice(WORDS) + " "}
+                yield chunk(completion_id, model, delta, index=index)
+            await asyncio.sleep(sleep_for(app.state.itl))
+        for index in range(n):
+            yield chunk(completion_id, model, {}, "stop", index=index)
+        if include_usage:
+            yield usage_chunk(completion_id, model, tokens * n)
+        yield b"data: [DONE]\n\n"
+    finally:
+        app.state.active -= 1
+        app.state.served += 1
+
+
+@app.post("/v1/chat/completions")
+async def completions(request: Request):
+    body = await request.json()
+    model = body.get("model") or "mock"
+    tokens = min(app.state.tokens, body.get("max_tokens") or app.state.tokens)
+    n = body.get("n") or 1
+    completion_id = f"chatcmpl-{random.getrandbits(64):x}"
+
+    if body.get("stream"):
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+        return StreamingResponse(
+            stream_reply(request, completion_id, model, tokens, n, include_usage),
+            media_type="text/event-stream",
+        )
+
+    await asyncio.sleep(sleep_for(app.state.ttft + app.state.itl * tokens))
+    return JSONResponse(
+        {
+            "id": completion_id,
+            "object": "chat.completion",
+            "model": model,
+            "choices": [
+                {
+                    "index": index,
+                    "message": {
+                        "role": "assistant",
+                        "content": " ".join(
+                            random.choice(WORDS) for _ in range(tokens)
+                        ),
+                    },
+                    "finish_reason": "stop",
+                }
+                for index in range(n)
+            ],
+            "usage": {"completion_tokens": tokens * n},
+        }
+    )
+
+
+@app.get("/health")
+async def health():
+    return {}
+
+
+@app.get("/stats")
+async def stats():
+    return {"active": app.state.active, "served": app.state.served}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--ttft-ms", type=float, default=150)
+    parser.add_argument("--itl-ms", type=float, default=20)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--jitter", type=float, default=0.0, help="fraction, e.g. 0.2")
+    args = parser.parse_args()
+
+    app.state.ttft = args.ttft_ms / 1000
+    app.state.itl = args.itl_ms / 1000
+    app.state.tokens = args.tokens
+    app.state.jitter = args.jitter
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+export async function GET(
+  req: Request,
+  { params }: { params: Promise<{ hash: string }> }
+): Promise<Response> {
+  const { hash } = await params;
+  const { search } = new URL(req.url);
+  const API_URL = process.env.API_URL;
+
+  const res = await fetch(`${API_URL}/media/${hash}${search}`);
+
+  return new Response(res.body, {
+    status: res.status,
+    headers: {
+      "Content-Type": res.headers.get("Content-Type") ?? "image/jpeg",
+      "Cache-Control": res.headers.get("Cache-Control") ?? "no-cache",
+    },
+  });
+}
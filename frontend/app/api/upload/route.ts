@@ -1,7 +1,5 @@
 import { NextRequest, NextResponse } from "next/server";
-import fs from "fs";
-import path from "path";
-import sharp from "sharp";
+import { cookies } from "next/headers";
 
 export const runtime = "nodejs";
 
@@ -14,30 +12,33 @@ export async function POST(req: NextRequest) {
       return NextResponse.json({ error: "No file uploaded" }, { status: 400 });
     }
 
-    const arrayBuffer = await file.arrayBuffer();
-    const buffer = Buffer.from(arrayBuffer);
-
-    const resized = await sharp(buffer)
-      .resize(512, 512, {
-        fit: "inside",
-        withoutEnlargement: true,
-      })
-      .toBuffer();
-
-    const uploadDir = path.join(process.cwd(), "public/uploads");
-    if (!fs.existsSync(uploadDir)) {
-      fs.mkdirSync(uploadDir, { recursive: true });
+    const cookieStore = await cookies();
+    const token = cookieStore.get("access_token")?.value;
+    const API_URL = process.env.API_URL;
+
+    // The API stores the image under its SHA-256 and builds the resized
+    // variants; the body is streamed through rather than buffered here.
+    const res = await fetch(`${API_URL}/media/upload`, {
+      method: "POST",
+      headers: {
+        "Content-Type": file.type || "application/octet-stream",
+        "Content-Length": String(file.size),
+        Authorization: token ? `Bearer ${token}` : "",
+      },
+      body: file.stream(),
+      // @ts-expect-error Node's fetch requires this for streamed bodies.
+      duplex: "half",
+    });
+
+    const data = await res.json();
+    if (!res.ok) {
+      return NextResponse.json(data, { status: res.status });
     }
 
-    const ext = file.name.split(".").pop()?.toLowerCase() || "jpg";
-    const filename = `${Date.now()}-${Math.random()
-      .toString(36)
-      .slice(2)}.${ext}`;
-    const filepath = path.join(uploadDir, filename);
-
-    fs.writeFileSync(filepath, resized);
-
-    return NextResponse.json({ url: `/uploads/${filename}` });
+    return NextResponse.json({
+      hash: data.hash,
+      url: `/api/media/${data.hash}?size=${Math.min(...data.variants)}`,
+    });
   } catch (err) {
     console.error("UPLOAD ERROR:", err);
     return NextResponse.json({ error: "Upload failed" }, { status: 500 });
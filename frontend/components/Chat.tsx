@@ -49,7 +49,7 @@ export default function Chat() {
     if ((!text && pendingImages.length === 0) || isStreaming) return;
 
     const imgMarkdown = pendingImages
-      .map((url) => `![image](${url})`)
+      .map((img) => `![image](${img.url})`)
       .join("\n\n");
 
     const displayContent = [text, imgMarkdown].filter(Boolean).join("\n\n");
@@ -73,7 +73,11 @@ export default function Chat() {
     setInput("");
     setPendingImages([]);
 
-    await sendChatRequest(text, pendingImages, assistantMessage.id);
+    await sendChatRequest(
+      text,
+      pendingImages.map((img) => img.hash),
+      assistantMessage.id
+    );
   };
 
   return (
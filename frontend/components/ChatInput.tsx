@@ -35,6 +35,7 @@ export default function ChatInput({
         const data = await res.json();
         const new_pending_image: PendingImage = {
           id: uuid(),
+          hash: data.hash,
           url: data.url,
         };
         setPendingImages((prev) => [...prev, new_pending_image]);
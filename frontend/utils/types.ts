@@ -9,5 +9,6 @@ export interface Message {
 
 export interface PendingImage {
   id: string;
+  hash: string;
   url: string;
 }
@@ -1,21 +1,38 @@
-from sqlalchemy import select
+from sqlalchemy import select, update
 
 from libs.auth.base import AuthBackend
-from libs.auth.hashing import verify_password
+from libs.auth.cache import invalidate_user
+from libs.auth.hashing import verify_and_update_password
 from libs.db import AsyncSessionLocal
 from libs.models import Users
 
 
 class PasswordAuthBackend(AuthBackend):
     async def authenticate(self, email: str, password: str):
+        # The session is closed before hashing: a login waiting for the
+        # hashing executor must not hold a pooled connection meanwhile.
         async with AsyncSessionLocal() as db:
             result = await db.execute(select(Users).where(Users.email == email))
             user = result.scalar_one_or_none()
 
-            if not user:
-                return None
+        if not user:
+            return None
 
-            if not verify_password(password, user.password_hash):
-                return None
+        valid, new_hash = await verify_and_update_password(
+            password, user.password_hash
+        )
+        if not valid:
+            return None
 
-            return user
+        if new_hash:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(Users)
+                    .where(Users.id == user.id)
+                    .values(password_hash=new_hash)
+                )
+                await db.commit()
+            user.password_hash = new_hash
+            await invalidate_user(user.id)
+
+        return user
@@ -0,0 +1,89 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from libs.cache import redis_client
+
+load_dotenv()
+
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_INVALIDATION_CHANNEL = "auth:user-invalidate"
+
+
+class TTLCache:
+    """Bounded LRU mapping whose entries also expire after a deadline."""
+
+    def __init__(self, maxsize: int, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float | None = None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl is None or ttl <= 0:
+            return
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+
+token_cache = TTLCache(TOKEN_CACHE_SIZE)
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+
+def cache_token(token: str, payload: dict):
+    # A verified token stays valid until its own expiry, never longer.
+    token_cache.set(token, payload, payload.get("exp", 0) - time.time())
+
+
+async def invalidate_user(user_id: int):
+    user_cache.pop(user_id)
+    await redis_client.publish(USER_INVALIDATION_CHANNEL, str(user_id))
+
+
+async def listen_for_invalidations():
+    pubsub = redis_client.pubsub()
+    try:
+        while True:
+            try:
+                if not pubsub.subscribed:
+                    await pubsub.subscribe(USER_INVALIDATION_CHANNEL)
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=None
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Invalidations may have been missed while disconnected.
+                user_cache.clear()
+                await pubsub.reset()
+                await asyncio.sleep(1)
+                continue
+
+            if message and message["type"] == "message":
+                user_cache.pop(int(message["data"]))
+    finally:
+        await pubsub.aclose()
@@ -1,11 +1,49 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
 from passlib.context import CryptContext
 
-pwd = CryptContext(schemes=["bcrypt"], deprecated="auto")
+load_dotenv()
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "4"))
+
+pwd = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+# bcrypt releases the GIL, so a small thread pool keeps hashing off the
+# event loop and caps how many hashes run at once.
+_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="hashing")
+_in_flight = 0
+
+
+def hashing_stats() -> dict:
+    return {
+        "workers": HASH_WORKERS,
+        "in_flight": _in_flight,
+        "queued": max(0, _in_flight - HASH_WORKERS),
+    }
+
+
+async def _run(fn, *args):
+    global _in_flight
+    _in_flight += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+    finally:
+        _in_flight -= 1
+
+
+async def hash_password(password: str) -> str:
+    return await _run(pwd.hash, password)
 
 
-def hash_password(password: str) -> str:
-    return pwd.hash(password)
+async def verify_password(password: str, hashed: str) -> bool:
+    return await _run(pwd.verify, password, hashed)
 
 
-def verify_password(password: str, hashed: str) -> bool:
-    return pwd.verify(password, hashed)
+async def verify_and_update_password(password: str, hashed: str):
+    """Return (valid, new_hash); new_hash is set when the stored hash uses
+    outdated cost parameters and should be replaced."""
+    return await _run(pwd.verify_and_update, password, hashed)
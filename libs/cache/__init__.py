@@ -0,0 +1,19 @@
+from .client import redis_client
+from .history import (
+    invalidate_history,
+    load_history,
+    push_history,
+    rebuild_history,
+)
+from .streams import (
+    GENERATION_CANCEL_CHANNEL,
+    add_viewer,
+    close_stream,
+    count_viewers,
+    open_stream,
+    publish_token,
+    read_stream,
+    read_streams,
+    remove_viewer,
+    stream_exists,
+)
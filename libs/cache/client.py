@@ -0,0 +1,9 @@
+import os
+
+from dotenv import load_dotenv
+from redis.asyncio import Redis
+
+load_dotenv()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+redis_client = Redis.from_url(REDIS_URL, decode_responses=True)
@@ -0,0 +1,67 @@
+import os
+
+import orjson
+from dotenv import load_dotenv
+
+from .client import redis_client
+
+load_dotenv()
+
+CHAT_HISTORY_CACHE_SIZE = int(os.getenv("CHAT_HISTORY_CACHE_SIZE", "64"))
+CHAT_HISTORY_CACHE_TTL = int(os.getenv("CHAT_HISTORY_CACHE_TTL", "3600"))
+
+
+def history_key(chat_id: int) -> str:
+    return f"chat:{chat_id}:history"
+
+
+def history_entry(message) -> str:
+    """Cache entry for a finished message row (ORM object or result row)."""
+    return orjson.dumps(
+        {
+            "id": message.id,
+            "parent_id": message.parent_id,
+            "role": message.sender.value,
+            "content": message.content,
+            "images": message.images,
+        }
+    ).decode()
+
+
+async def load_history(chat_id: int) -> dict[int, dict] | None:
+    """Cached recent messages of a chat by id, or None when not cached."""
+    entries = await redis_client.lrange(history_key(chat_id), 0, -1)
+    if not entries:
+        return None
+    return {entry["id"]: entry for entry in map(orjson.loads, entries)}
+
+
+async def push_history(chat_id: int, *messages):
+    # LPUSHX only extends a list that is already there: a chat that is not
+    # cached stays that way until the next rebuild, instead of being cached
+    # with holes.
+    key = history_key(chat_id)
+    async with redis_client.pipeline(transaction=True) as pipe:
+        for message in messages:
+            pipe.lpushx(key, history_entry(message))
+        pipe.ltrim(key, 0, CHAT_HISTORY_CACHE_SIZE - 1)
+        pipe.expire(key, CHAT_HISTORY_CACHE_TTL)
+        await pipe.execute()
+
+
+async def rebuild_history(chat_id: int, messages):
+    """Replace the cached history with `messages`, newest first."""
+    key = history_key(chat_id)
+    entries = [history_entry(m) for m in messages[:CHAT_HISTORY_CACHE_SIZE]]
+    if not entries:
+        return
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.delete(key)
+        pipe.rpush(key, *entries)
+        pipe.expire(key, CHAT_HISTORY_CACHE_TTL)
+        await pipe.execute()
+
+
+async def invalidate_history(*chat_ids: int):
+    if chat_ids:
+        await redis_client.delete(*map(history_key, chat_ids))
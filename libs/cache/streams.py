@@ -0,0 +1,123 @@
+import os
+
+from dotenv import load_dotenv
+
+from .client import redis_client
+
+load_dotenv()
+
+GENERATION_STREAM_TTL = int(os.getenv("GENERATION_STREAM_TTL", "3600"))
+STREAM_BLOCK_MS = int(os.getenv("STREAM_BLOCK_MS", "5000"))
+STREAM_READ_COUNT = int(os.getenv("STREAM_READ_COUNT", "256"))
+
+
+GENERATION_CANCEL_CHANNEL = "generation:cancel"
+
+
+def generation_key(message_id: int) -> str:
+    return f"generation:{message_id}"
+
+
+def viewers_key(message_id: int) -> str:
+    return f"generation:{message_id}:viewers"
+
+
+async def add_viewer(message_id: int) -> int:
+    key = viewers_key(message_id)
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.incr(key)
+        pipe.expire(key, GENERATION_STREAM_TTL)
+        viewers, _ = await pipe.execute()
+    return viewers
+
+
+async def remove_viewer(message_id: int) -> int:
+    return await redis_client.decr(viewers_key(message_id))
+
+
+async def count_viewers(message_id: int) -> int:
+    return int(await redis_client.get(viewers_key(message_id)) or 0)
+
+
+async def open_stream(message_id: int, meta: bytes):
+    key = generation_key(message_id)
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.xadd(key, {"meta": meta})
+        # Bounds the lifetime of a stream whose producer died mid-generation.
+        pipe.expire(key, GENERATION_STREAM_TTL)
+        await pipe.execute()
+
+
+async def publish_token(message_id: int, token: str):
+    await redis_client.xadd(generation_key(message_id), {"token": token})
+
+
+async def close_stream(message_id: int, status: str):
+    key = generation_key(message_id)
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.xadd(key, {"done": status})
+        pipe.expire(key, GENERATION_STREAM_TTL)
+        await pipe.execute()
+
+
+async def stream_exists(message_id: int) -> bool:
+    return bool(await redis_client.exists(generation_key(message_id)))
+
+
+async def read_stream(message_id: int, offset: str = "0"):
+    """Yield batches of (entry_id, fields) from `offset` onwards, replaying
+    what is already stored and then following live until the `done` entry.
+
+    An empty batch is yielded whenever a blocking read times out, so the
+    caller gets a chance to notice that its client went away.
+    """
+    key = generation_key(message_id)
+    while True:
+        result = await redis_client.xread(
+            {key: offset}, block=STREAM_BLOCK_MS, count=STREAM_READ_COUNT
+        )
+        if not result:
+            if not await redis_client.exists(key):
+                return
+            yield []
+            continue
+
+        entries = result[0][1]
+        for i, (entry_id, fields) in enumerate(entries):
+            if "done" in fields:
+                yield entries[: i + 1]
+                return
+        offset = entries[-1][0]
+        yield entries
+
+
+async def read_streams(message_ids: list[int], offset: str = "0"):
+    """Yield batches of (message_id, entries) from several streams at once,
+    following each until its `done` entry; one XREAD serves all of them.
+
+    Like read_stream, an empty batch is yielded when a blocking read times
+    out.
+    """
+    offsets = {generation_key(message_id): offset for message_id in message_ids}
+    ids = {generation_key(message_id): message_id for message_id in message_ids}
+    while offsets:
+        result = await redis_client.xread(
+            offsets, block=STREAM_BLOCK_MS, count=STREAM_READ_COUNT
+        )
+        if not result:
+            if not await redis_client.exists(*offsets):
+                return
+            yield []
+            continue
+
+        batch = []
+        for key, entries in result:
+            for i, (entry_id, fields) in enumerate(entries):
+                if "done" in fields:
+                    entries = entries[: i + 1]
+                    del offsets[key]
+                    break
+            else:
+                offsets[key] = entries[-1][0]
+            batch.append((ids[key], entries))
+        yield batch
@@ -1,3 +1,3 @@
-from .engine import engine
+from .engine import engine, read_engine
 from .init_db import init_db
-from .session import AsyncSessionLocal, get_db
+from .session import AsyncSessionLocal, ReadSessionLocal, get_db, get_read_db
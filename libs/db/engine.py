@@ -5,9 +5,36 @@ from sqlalchemy.ext.asyncio import create_async_engine
 
 load_dotenv()
 DATABASE_URL = str(os.getenv("DATABASE_URL"))
+# Read-only queries go here when set; otherwise they share the primary.
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
 
-engine = create_async_engine(
-    DATABASE_URL,
-    echo=False,
-    future=True,
-)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Per-connection asyncpg prepared statement cache; set to 0 behind
+# PgBouncer in transaction mode.
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))
+
+
+def create_engine(url: str):
+    connect_args = {}
+    if url.startswith("postgresql+asyncpg"):
+        connect_args["prepared_statement_cache_size"] = DB_STATEMENT_CACHE_SIZE
+
+    return create_async_engine(
+        url,
+        echo=False,
+        future=True,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+
+
+engine = create_engine(DATABASE_URL)
+read_engine = create_engine(DATABASE_READ_URL) if DATABASE_READ_URL else engine
@@ -1,6 +1,6 @@
 from sqlalchemy.ext.asyncio import async_sessionmaker
 
-from .engine import engine
+from .engine import engine, read_engine
 
 AsyncSessionLocal = async_sessionmaker(
     bind=engine,
@@ -8,7 +8,21 @@ AsyncSessionLocal = async_sessionmaker(
     expire_on_commit=False,
 )
 
+# Replica reads may lag the primary, so anything that must see a write made
+# moments ago (a turn's own history, ownership checks on a fresh message)
+# stays on AsyncSessionLocal.
+ReadSessionLocal = async_sessionmaker(
+    bind=read_engine,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
 
 async def get_db():
     async with AsyncSessionLocal() as session:
         yield session
+
+
+async def get_read_db():
+    async with ReadSessionLocal() as session:
+        yield session
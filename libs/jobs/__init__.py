@@ -0,0 +1 @@
+from .summary import claim_due_summaries, enqueue_summary
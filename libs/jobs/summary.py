@@ -0,0 +1,43 @@
+import os
+import time
+
+from dotenv import load_dotenv
+
+from libs.cache import redis_client
+
+load_dotenv()
+SUMMARY_DEBOUNCE_SECONDS = float(os.getenv("SUMMARY_DEBOUNCE_SECONDS", "5"))
+SUMMARY_QUEUE_KEY = "jobs:summary"
+# Only needs to outlive the debounce; a chat's latest tip is kept this long.
+SUMMARY_TIP_TTL = int(os.getenv("SUMMARY_TIP_TTL", "86400"))
+
+
+def summary_tip_key(chat_id) -> str:
+    return f"{SUMMARY_QUEUE_KEY}:tip:{chat_id}"
+
+
+async def enqueue_summary(chat_id: int, tip_id: int):
+    # Re-adding a chat pushes its due time back, so a burst of turns
+    # collapses into a single summary once the chat goes quiet. Summaries
+    # follow a branch: the job summarizes the one extended last, ending at
+    # `tip_id`.
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.set(summary_tip_key(chat_id), tip_id, ex=SUMMARY_TIP_TTL)
+        pipe.zadd(
+            SUMMARY_QUEUE_KEY, {str(chat_id): time.time() + SUMMARY_DEBOUNCE_SECONDS}
+        )
+        await pipe.execute()
+
+
+async def claim_due_summaries(batch: int = 10) -> list[tuple[int, int]]:
+    """Due jobs as (chat id, tip message id)."""
+    due = await redis_client.zrangebyscore(
+        SUMMARY_QUEUE_KEY, "-inf", time.time(), start=0, num=batch
+    )
+    claimed = []
+    for chat_id in due:
+        if await redis_client.zrem(SUMMARY_QUEUE_KEY, chat_id):
+            tip_id = await redis_client.get(summary_tip_key(chat_id))
+            if tip_id is not None:
+                claimed.append((int(chat_id), int(tip_id)))
+    return claimed
@@ -0,0 +1,11 @@
+from .admission import (
+    BACKGROUND,
+    INTERACTIVE,
+    AdmissionController,
+    AdmissionRejected,
+)
+from .balancer import UpstreamPool, UpstreamUnavailable
+from .client import MODEL, MODEL_TEMPERATURE, VLLM_URL, create_upstream_client
+from .sse import iter_choice_deltas, sse_frame
+from .summarizer import summarize_history
+from .tokenizer import count_message_tokens, count_tokens, get_tokenizer
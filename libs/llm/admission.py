@@ -0,0 +1,156 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "32"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "256"))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "10"))
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"upstream saturated, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Caps in-flight upstream requests and hands freed slots out fairly.
+
+    Waiters are grouped by priority and, inside a priority, by user. A
+    freed slot goes to the highest priority with waiters, and users are
+    served round-robin, so one user's burst cannot starve the others.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = ADMISSION_MAX_CONCURRENCY,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        max_wait: float = ADMISSION_MAX_WAIT,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiting = 0
+        self.queues: dict[int, OrderedDict] = {
+            INTERACTIVE: OrderedDict(),
+            BACKGROUND: OrderedDict(),
+        }
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        # Moving average of how long a slot is held, for Retry-After.
+        self.avg_hold = 1.0
+
+    def retry_after(self) -> int:
+        backlog = (self.waiting + 1) / max(1, self.max_concurrency)
+        return max(1, math.ceil(backlog * self.avg_hold))
+
+    async def acquire(self, user_id, priority: int = INTERACTIVE):
+        if self.active < self.max_concurrency and self.waiting == 0:
+            self.active += 1
+            self.admitted += 1
+            return
+
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected(self.retry_after())
+
+        fut = asyncio.get_running_loop().create_future()
+        self.queues[priority].setdefault(user_id, deque()).append(fut)
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(fut, self.max_wait)
+        except asyncio.TimeoutError:
+            # _wake may have granted the slot just as the wait ran out.
+            if fut.done() and not fut.cancelled():
+                self.release()
+            else:
+                self._discard(priority, user_id, fut)
+            self.timed_out += 1
+            raise AdmissionRejected(self.retry_after())
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()
+            else:
+                self._discard(priority, user_id, fut)
+            raise
+        self.admitted += 1
+
+    def release(self, held_for: float | None = None):
+        if held_for is not None:
+            self.avg_hold = 0.9 * self.avg_hold + 0.1 * held_for
+        self.active -= 1
+        self._wake()
+
+    def _discard(self, priority, user_id, fut):
+        waiters = self.queues[priority].get(user_id)
+        if waiters and fut in waiters:
+            waiters.remove(fut)
+            self.waiting -= 1
+            if not waiters:
+                del self.queues[priority][user_id]
+
+    def _wake(self):
+        while self.active < self.max_concurrency:
+            fut = self._next_waiter()
+            if fut is None:
+                return
+            self.active += 1
+            fut.set_result(None)
+
+    def _next_waiter(self):
+        for priority in sorted(self.queues):
+            users = self.queues[priority]
+            while users:
+                user_id, waiters = next(iter(users.items()))
+                fut = waiters.popleft()
+                self.waiting -= 1
+                # Rotate the user to the back of the line.
+                del users[user_id]
+                if waiters:
+                    users[user_id] = waiters
+                if not fut.done():
+                    return fut
+        return None
+
+    @asynccontextmanager
+    async def slot(self, user_id, priority: int = INTERACTIVE):
+        await self.acquire(user_id, priority)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def _queued(self, priority: int) -> int:
+        return sum(len(waiters) for waiters in self.queues[priority].values())
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "max_concurrency": self.max_concurrency,
+            "waiting": self.waiting,
+            "max_queue": self.max_queue,
+            "waiting_by_priority": {
+                "interactive": self._queued(INTERACTIVE),
+                "background": self._queued(BACKGROUND),
+            },
+            "waiting_users": len(
+                set(self.queues[INTERACTIVE]) | set(self.queues[BACKGROUND])
+            ),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_hold_seconds": round(self.avg_hold, 3),
+        }
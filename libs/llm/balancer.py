@@ -0,0 +1,196 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+from dotenv import load_dotenv
+
+from libs.telemetry import UPSTREAM_CONNECT_SECONDS, timed
+
+from .client import VLLM_URL
+
+load_dotenv()
+
+CHAT_COMPLETIONS_PATH = "/v1/chat/completions"
+VLLM_URLS = [
+    url.strip().rstrip("/")
+    for url in os.getenv(
+        "VLLM_URLS", VLLM_URL.removesuffix(CHAT_COMPLETIONS_PATH)
+    ).split(",")
+    if url.strip()
+]
+VLLM_HEALTH_PATH = os.getenv("VLLM_HEALTH_PATH", "/health")
+VLLM_HEALTH_INTERVAL = float(os.getenv("VLLM_HEALTH_INTERVAL", "5"))
+VLLM_HEALTH_TIMEOUT = float(os.getenv("VLLM_HEALTH_TIMEOUT", "2"))
+VLLM_RETRIES = int(os.getenv("VLLM_RETRIES", "2"))
+VLLM_AFFINITY = os.getenv("VLLM_AFFINITY", "true").lower() == "true"
+# How many more in-flight requests the affine backend may carry than the
+# least loaded one before affinity is given up for balance.
+VLLM_AFFINITY_SLACK = int(os.getenv("VLLM_AFFINITY_SLACK", "4"))
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamUnavailable(Exception):
+    pass
+
+
+class Backend:
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+        self.last_checked = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "failures": self.failures,
+        }
+
+
+class UpstreamPool:
+    """Routes OpenAI-compatible requests over several vLLM servers.
+
+    Requests go to the backend with the fewest outstanding requests. With
+    an affinity key (the chat id), the backend chosen by rendezvous hashing
+    is preferred while it is not much busier, so follow-up turns hit the
+    server that still holds the conversation prefix in its KV cache.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, urls: list[str] = VLLM_URLS):
+        self.client = client
+        self.backends = [Backend(url) for url in urls]
+        self._health_task: asyncio.Task | None = None
+
+    def start(self):
+        if VLLM_HEALTH_INTERVAL > 0:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def aclose(self):
+        if self._health_task:
+            self._health_task.cancel()
+        await self.client.aclose()
+
+    def pick(self, affinity_key=None, exclude=()) -> Backend | None:
+        candidates = [b for b in self.backends if b.url not in exclude]
+        healthy = [b for b in candidates if b.healthy]
+        # With every backend ejected, trying one beats failing outright.
+        candidates = healthy or candidates
+        if not candidates:
+            return None
+
+        least = min(candidates, key=lambda b: b.outstanding)
+        if affinity_key is None or not VLLM_AFFINITY:
+            return least
+
+        affine = max(
+            candidates,
+            key=lambda b: hashlib.blake2b(f"{affinity_key}:{b.url}".encode()).digest(),
+        )
+        if affine.outstanding <= least.outstanding + VLLM_AFFINITY_SLACK:
+            return affine
+        return least
+
+    def _mark_down(self, backend: Backend):
+        backend.failures += 1
+        if backend.healthy:
+            logger.warning("ejecting upstream %s", backend.url)
+        backend.healthy = False
+
+    async def _send(self, payload: dict, affinity_key, stream: bool, route: str):
+        # Failures are retried on another backend only up to the point a
+        # response starts, so nothing is ever sent to the client twice.
+        tried = set()
+        last_error = None
+        for _ in range(VLLM_RETRIES + 1):
+            backend = self.pick(affinity_key, tried)
+            if backend is None:
+                break
+            tried.add(backend.url)
+
+            backend.outstanding += 1
+            try:
+                request = self.client.build_request(
+                    "POST", backend.url + CHAT_COMPLETIONS_PATH, json=payload
+                )
+                with timed(
+                    UPSTREAM_CONNECT_SECONDS,
+                    "upstream_connect",
+                    backend=backend.url,
+                    route=route,
+                    model=payload.get("model", ""),
+                ):
+                    response = await self.client.send(request, stream=stream)
+            except httpx.TransportError as e:
+                backend.outstanding -= 1
+                self._mark_down(backend)
+                last_error = e
+                continue
+
+            if response.status_code >= 500:
+                await response.aclose()
+                backend.outstanding -= 1
+                backend.failures += 1
+                last_error = httpx.HTTPStatusError(
+                    f"upstream returned {response.status_code}",
+                    request=request,
+                    response=response,
+                )
+                continue
+
+            if response.is_error:
+                await response.aclose()
+                backend.outstanding -= 1
+                response.raise_for_status()
+
+            return response, backend
+
+        raise UpstreamUnavailable(str(last_error or "no upstream available"))
+
+    @asynccontextmanager
+    async def stream(self, payload: dict, affinity_key=None, route: str = ""):
+        response, backend = await self._send(payload, affinity_key, True, route)
+        try:
+            yield response
+        finally:
+            await response.aclose()
+            backend.outstanding -= 1
+
+    async def post(
+        self, payload: dict, affinity_key=None, route: str = ""
+    ) -> httpx.Response:
+        response, backend = await self._send(payload, affinity_key, False, route)
+        backend.outstanding -= 1
+        return response
+
+    async def _check(self, backend: Backend):
+        try:
+            r = await self.client.get(
+                backend.url + VLLM_HEALTH_PATH, timeout=VLLM_HEALTH_TIMEOUT
+            )
+            ok = r.status_code == 200
+        except httpx.HTTPError:
+            ok = False
+
+        backend.last_checked = time.monotonic()
+        if ok and not backend.healthy:
+            logger.info("upstream %s is healthy again", backend.url)
+        if ok:
+            backend.healthy = True
+        else:
+            self._mark_down(backend)
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.gather(*(self._check(b) for b in self.backends))
+            await asyncio.sleep(VLLM_HEALTH_INTERVAL)
+
+    def stats(self) -> list[dict]:
+        return [b.stats() for b in self.backends]
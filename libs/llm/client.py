@@ -0,0 +1,40 @@
+import os
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MODEL = os.getenv("CHAT_MODEL")
+VLLM_URL = os.getenv("VLLM_URL", "http://localhost:8000/v1/chat/completions")
+MODEL_TEMPERATURE = os.getenv("MODEL_TEMPERATURE")
+
+VLLM_POOL_SIZE = int(os.getenv("VLLM_POOL_SIZE", "100"))
+VLLM_KEEPALIVE_CONNECTIONS = int(os.getenv("VLLM_KEEPALIVE_CONNECTIONS", "20"))
+VLLM_KEEPALIVE_EXPIRY = float(os.getenv("VLLM_KEEPALIVE_EXPIRY", "30"))
+VLLM_CONNECT_TIMEOUT = float(os.getenv("VLLM_CONNECT_TIMEOUT", "5"))
+VLLM_READ_TIMEOUT = float(os.getenv("VLLM_READ_TIMEOUT", "120"))
+VLLM_POOL_TIMEOUT = float(os.getenv("VLLM_POOL_TIMEOUT", "10"))
+VLLM_HTTP2 = os.getenv("VLLM_HTTP2", "false").lower() == "true"
+
+
+def create_upstream_client() -> httpx.AsyncClient:
+    """Long-lived pooled client for the OpenAI-compatible upstream.
+
+    The read timeout bounds the gap between two chunks, not the whole
+    generation, so a long streamed reply is fine but a stalled server is not.
+    """
+    return httpx.AsyncClient(
+        http2=VLLM_HTTP2,
+        limits=httpx.Limits(
+            max_connections=VLLM_POOL_SIZE,
+            max_keepalive_connections=VLLM_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=VLLM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            connect=VLLM_CONNECT_TIMEOUT,
+            read=VLLM_READ_TIMEOUT,
+            write=VLLM_CONNECT_TIMEOUT,
+            pool=VLLM_POOL_TIMEOUT,
+        ),
+    )
@@ -0,0 +1,40 @@
+import orjson
+
+DONE = "[DONE]"
+
+
+async def iter_choice_deltas(response, usage: dict | None = None):
+    """Yield `(choice index, delta.content)` pairs of an OpenAI-compatible
+    SSE stream, so requests asking for several completions with `n` work.
+
+    Chunks without any content (role headers, finish markers) are recognised
+    by a substring check and never reach the JSON parser.
+
+    With `stream_options.include_usage` set on the request, the final usage
+    chunk is copied into `usage`.
+    """
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+
+        payload = line[5:].strip()
+        if payload == DONE:
+            return
+        if '"content"' not in payload:
+            if usage is not None and '"usage"' in payload:
+                usage.update(orjson.loads(payload).get("usage") or {})
+            continue
+
+        for choice in orjson.loads(payload).get("choices") or ():
+            delta = (choice.get("delta") or {}).get("content")
+            if delta:
+                yield choice.get("index", 0), delta
+
+
+def sse_frame(data, event_id: str | None = None) -> bytes:
+    body = data if isinstance(data, (bytes, str)) else orjson.dumps(data)
+    if isinstance(body, str):
+        body = body.encode()
+    if event_id is None:
+        return b"data: " + body + b"\n\n"
+    return b"id: " + event_id.encode() + b"\ndata: " + body + b"\n\n"
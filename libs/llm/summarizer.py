@@ -0,0 +1,37 @@
+from .balancer import UpstreamPool
+from .client import MODEL, MODEL_TEMPERATURE
+
+
+async def summarize_history(
+    upstream: UpstreamPool, summary: str | None, history, affinity_key=None
+):
+    dialog_text = "\n".join(f"{m['role'].upper()}: {m['content']}" for m in history)
+
+    user_prompt = (
+        "Update the persistent conversation summary.\n\n"
+        "Rules:\n"
+        "- Keep user facts, preferences, goals.\n"
+        "- Remove chit-chat.\n"
+        "- Keep it short, accurate, factual.\n"
+        "- Never contradict previous summary.\n\n"
+        f"PREVIOUS SUMMARY:\n{summary or '(empty)'}\n\n"
+        f"NEW DIALOG:\n{dialog_text}\n\n"
+        "UPDATED SUMMARY:"
+    )
+
+    r = await upstream.post(
+        {
+            "model": MODEL,
+            "messages": [
+                {"role": "system", "content": "You are a memory engine."},
+                {"role": "user", "content": user_prompt},
+            ],
+            "stream": False,
+            "temperature": MODEL_TEMPERATURE,
+        },
+        affinity_key=affinity_key,
+        route="summary",
+    )
+
+    resp = r.json()
+    return resp["choices"][0]["message"]["content"].strip()
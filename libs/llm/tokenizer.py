@@ -0,0 +1,28 @@
+import os
+from functools import lru_cache
+
+from dotenv import load_dotenv
+
+from .client import MODEL
+
+load_dotenv()
+TOKENIZER_NAME = os.getenv("TOKENIZER_NAME") or MODEL
+
+# Rough per-message cost of the chat template (role markers, separators).
+MESSAGE_TOKEN_OVERHEAD = int(os.getenv("MESSAGE_TOKEN_OVERHEAD", "4"))
+
+
+@lru_cache(maxsize=1)
+def get_tokenizer():
+    from transformers import AutoTokenizer
+
+    return AutoTokenizer.from_pretrained(TOKENIZER_NAME)
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    return len(get_tokenizer().encode(text, add_special_tokens=False))
+
+
+def count_message_tokens(message: dict) -> int:
+    return count_tokens(message["content"]) + MESSAGE_TOKEN_OVERHEAD
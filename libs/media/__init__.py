@@ -0,0 +1,14 @@
+from .storage import (
+    IMAGE_VARIANT_SIZES,
+    MEDIA_ROOT,
+    UPLOAD_MAX_BYTES,
+    InvalidImage,
+    UploadTooLarge,
+    image_exists,
+    image_meta,
+    image_note,
+    is_image_hash,
+    media_path,
+    shutdown_media,
+    store_image,
+)
@@ -0,0 +1,30 @@
+import os
+
+from PIL import Image, ImageOps
+
+
+def make_variants(source: str, sizes: tuple[int, ...], target: str) -> dict:
+    """Validate an image and write a JPEG next to `target` for each
+    longest-edge size. Runs in a worker process, so it only touches the
+    filesystem."""
+    with Image.open(source) as image:
+        image.verify()
+
+    with Image.open(source) as image:
+        content_type = Image.MIME.get(image.format, "application/octet-stream")
+        image = ImageOps.exif_transpose(image)
+        width, height = image.size
+
+        for size in sizes:
+            path = f"{target}_{size}.jpg"
+            if os.path.exists(path):
+                continue
+            variant = image.copy()
+            variant.thumbnail((size, size))
+            if variant.mode != "RGB":
+                variant = variant.convert("RGB")
+            partial = f"{path}.{os.getpid()}.tmp"
+            variant.save(partial, "JPEG", quality=85, optimize=True)
+            os.replace(partial, path)
+
+    return {"content_type": content_type, "width": width, "height": height}
@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterator
+
+import orjson
+from dotenv import load_dotenv
+
+from .processing import make_variants
+
+load_dotenv()
+
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", "media")
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+UPLOAD_WRITE_BYTES = int(os.getenv("UPLOAD_WRITE_BYTES", str(1024 * 1024)))
+IMAGE_VARIANT_SIZES = tuple(
+    int(size) for size in os.getenv("IMAGE_VARIANT_SIZES", "512,1024").split(",")
+)
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", "2"))
+
+_HASH = re.compile(r"[0-9a-f]{64}")
+
+# Decoding and resizing are CPU-bound and hold the GIL, so they run in
+# separate processes. Spawned, not forked, so workers do not inherit the
+# event loop or the tokenizer's threads.
+_executor: ProcessPoolExecutor | None = None
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class InvalidImage(Exception):
+    pass
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=MEDIA_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+
+def shutdown_media():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def is_image_hash(value: str) -> bool:
+    return bool(_HASH.fullmatch(value))
+
+
+def media_path(digest: str, size: int | None = None) -> str:
+    path = os.path.join(MEDIA_ROOT, digest[:2], digest)
+    return f"{path}_{size}.jpg" if size else path
+
+
+def _meta_path(digest: str) -> str:
+    return media_path(digest) + ".json"
+
+
+def image_exists(digest: str) -> bool:
+    # The metadata file is written last, so it marks a fully processed image.
+    return is_image_hash(digest) and os.path.exists(_meta_path(digest))
+
+
+def image_meta(digest: str) -> dict | None:
+    try:
+        with open(_meta_path(digest), "rb") as f:
+            return orjson.loads(f.read())
+    except FileNotFoundError:
+        return None
+
+
+def image_note(images) -> str:
+    """Prompt text standing in for attached images."""
+    return "\n[User sent images: " + ", ".join(images) + "]" if images else ""
+
+
+async def _write_upload(chunks: AsyncIterator[bytes], f) -> tuple[str, int]:
+    digest = hashlib.sha256()
+    size = 0
+    buffer = bytearray()
+    async for chunk in chunks:
+        size += len(chunk)
+        if size > UPLOAD_MAX_BYTES:
+            raise UploadTooLarge()
+        digest.update(chunk)
+        buffer += chunk
+        if len(buffer) >= UPLOAD_WRITE_BYTES:
+            await asyncio.to_thread(f.write, bytes(buffer))
+            buffer.clear()
+    if buffer:
+        await asyncio.to_thread(f.write, bytes(buffer))
+    return digest.hexdigest(), size
+
+
+async def store_image(chunks: AsyncIterator[bytes]) -> dict:
+    """Stream an upload to disk, hashing it on the way, and keep it under its
+    SHA-256. A hash that is already stored is not written or processed again."""
+    tmp_dir = os.path.join(MEDIA_ROOT, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            digest, size = await _write_upload(chunks, f)
+        if size == 0:
+            raise InvalidImage()
+
+        meta = image_meta(digest)
+        if meta is not None:
+            return {"hash": digest, "deduplicated": True, **meta}
+
+        # The upload is validated from this request's own temp file and only
+        # moved into place once it has passed: a concurrent upload of the
+        # same image may already be serving or processing `target`.
+        target = media_path(digest)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        loop = asyncio.get_running_loop()
+        try:
+            meta = await loop.run_in_executor(
+                _get_executor(), make_variants, tmp, IMAGE_VARIANT_SIZES, target
+            )
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM on a huge image); start a fresh pool
+            # for the next upload rather than failing every one after it.
+            shutdown_media()
+            raise
+        except Exception as e:
+            raise InvalidImage() from e
+        os.replace(tmp, target)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    meta = {**meta, "bytes": size, "variants": list(IMAGE_VARIANT_SIZES)}
+    partial = f"{_meta_path(digest)}.{os.getpid()}.tmp"
+    with open(partial, "wb") as f:
+        f.write(orjson.dumps(meta))
+    os.replace(partial, _meta_path(digest))
+    return {"hash": digest, "deduplicated": False, **meta}
@@ -0,0 +1,10 @@
+from .embedders import EMBEDDING_DIM, Embedder, HashingEmbedder, get_embedder
+from .recall import (
+    MEMORY_ENABLED,
+    MEMORY_TOP_K,
+    memory_indexed_since,
+    memory_watermark,
+    recall,
+    remember,
+)
+from .store import MEMORY_ROOT, MemoryIndex, get_index
@@ -0,0 +1,63 @@
+import importlib
+import os
+import re
+import zlib
+from functools import lru_cache
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "hashing" or the import path of an Embedder subclass ("package.module:Class").
+MEMORY_EMBEDDER = os.getenv("MEMORY_EMBEDDER", "hashing")
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "512"))
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+class Embedder:
+    """Turns texts into L2-normalised float32 rows of width `dim`."""
+
+    dim: int
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        raise NotImplementedError
+
+
+class HashingEmbedder(Embedder):
+    """Feature hashing of word unigrams and bigrams with sublinear term
+    frequency. Needs no model or GPU and is stable across processes, so the
+    API and the worker always agree on a vector."""
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+
+    def _features(self, text: str):
+        words = _WORD.findall(text.lower())
+        yield from words
+        yield from (f"{a} {b}" for a, b in zip(words, words[1:]))
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts: dict[int, float] = {}
+            for feature in self._features(text):
+                h = zlib.crc32(feature.encode())
+                # The top bit picks a sign so collisions tend to cancel out.
+                index = h % self.dim
+                counts[index] = counts.get(index, 0.0) + (1.0 if h >> 31 else -1.0)
+            for index, count in counts.items():
+                vectors[row, index] = np.sign(count) * np.log1p(abs(count))
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+
+@lru_cache(maxsize=1)
+def get_embedder() -> Embedder:
+    if MEMORY_EMBEDDER == "hashing":
+        return HashingEmbedder()
+    module, _, name = MEMORY_EMBEDDER.partition(":")
+    return getattr(importlib.import_module(module), name)()
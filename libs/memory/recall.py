@@ -0,0 +1,50 @@
+import asyncio
+import os
+
+import numpy as np
+from dotenv import load_dotenv
+
+from .embedders import get_embedder
+from .store import ID_DTYPE, get_index
+
+load_dotenv()
+
+MEMORY_ENABLED = os.getenv("MEMORY_ENABLED", "true").lower() == "true"
+MEMORY_TOP_K = int(os.getenv("MEMORY_TOP_K", "4"))
+MEMORY_MIN_SCORE = float(os.getenv("MEMORY_MIN_SCORE", "0.25"))
+
+
+def _remember(user_id: int, messages, watermark: int):
+    embedder = get_embedder()
+    vectors = embedder.embed([m.content for m in messages]).astype(np.float32)
+    ids = np.array([(m.id, m.chat_id) for m in messages], dtype=ID_DTYPE)
+    index = get_index(user_id, embedder.dim)
+    index.append(vectors, ids, watermark)
+    index.compact()
+
+
+def _recall(user_id: int, text: str, k: int, exclude):
+    embedder = get_embedder()
+    query = embedder.embed([text])[0]
+    hits = get_index(user_id, embedder.dim).search(query, k, exclude)
+    return [hit for hit in hits if hit[0] >= MEMORY_MIN_SCORE]
+
+
+def memory_watermark(user_id: int) -> int:
+    return get_index(user_id, get_embedder().dim).watermark()
+
+
+def memory_indexed_since(user_id: int, watermark: int) -> set[int]:
+    return get_index(user_id, get_embedder().dim).indexed_since(watermark)
+
+
+async def remember(user_id: int, messages, watermark: int):
+    """Embed and index `messages` (rows with id, chat_id and content)."""
+    await asyncio.to_thread(_remember, user_id, messages, watermark)
+
+
+async def recall(
+    user_id: int, text: str, k: int = MEMORY_TOP_K, exclude=frozenset()
+) -> list[tuple[float, int, int]]:
+    """(score, message_id, chat_id) of the user's messages closest to `text`."""
+    return await asyncio.to_thread(_recall, user_id, text, k, exclude)
@@ -0,0 +1,199 @@
+import fcntl
+import os
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Lock
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MEMORY_ROOT = os.getenv("MEMORY_ROOT", "memory")
+MEMORY_SEGMENT_ROWS = int(os.getenv("MEMORY_SEGMENT_ROWS", "4096"))
+MEMORY_MAX_SEGMENTS = int(os.getenv("MEMORY_MAX_SEGMENTS", "8"))
+MEMORY_OPEN_INDEXES = int(os.getenv("MEMORY_OPEN_INDEXES", "256"))
+
+# Each row's (message_id, chat_id), stored next to the vectors.
+ID_DTYPE = np.dtype([("message_id", "<i8"), ("chat_id", "<i8")])
+
+
+class MemoryIndex:
+    """One user's vectors, kept as append-only float32 segments on disk.
+
+    Segment `n` is a pair of files: `{n}.f32` with the row-major vectors and
+    `{n}.ids` with their ids. Rows are only ever appended to the newest
+    segment; once it holds MEMORY_SEGMENT_ROWS a new one is started, and
+    compaction merges the segments into a new one so a search maps a handful
+    of files. Numbers only grow and a file is never replaced in place.
+    Readers memory-map the segments, so search costs one matrix-vector
+    product per segment and no copy of the data.
+    """
+
+    def __init__(self, user_id: int, dim: int):
+        self.path = os.path.join(MEMORY_ROOT, str(user_id))
+        self.dim = dim
+        self._maps: dict[int, tuple[int, np.ndarray, np.ndarray]] = {}
+
+    def _segments(self) -> list[int]:
+        try:
+            names = os.listdir(self.path)
+        except FileNotFoundError:
+            return []
+        return sorted(int(n[:-4]) for n in names if n.endswith(".f32"))
+
+    def _file(self, segment: int, suffix: str) -> str:
+        return os.path.join(self.path, f"{segment:08d}{suffix}")
+
+    @contextmanager
+    def _locked(self):
+        # Serialises writers (indexing, compaction) across worker processes.
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, "lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _rows(self, segment: int) -> int:
+        vectors = os.path.getsize(self._file(segment, ".f32")) // (4 * self.dim)
+        ids = os.path.getsize(self._file(segment, ".ids")) // ID_DTYPE.itemsize
+        # A reader can catch an append half done; only whole pairs count.
+        return min(vectors, ids)
+
+    def _map(self, segment: int):
+        rows = self._rows(segment)
+        if not rows:
+            # Just created by an append; mmap refuses an empty file.
+            return np.empty((0, self.dim), np.float32), np.empty(0, ID_DTYPE)
+        cached = self._maps.get(segment)
+        if cached is None or cached[0] != rows:
+            name = self._file(segment, "")
+            vectors = np.memmap(
+                name + ".f32", dtype=np.float32, mode="r", shape=(rows, self.dim)
+            )
+            ids = np.memmap(name + ".ids", dtype=ID_DTYPE, mode="r", shape=(rows,))
+            cached = self._maps[segment] = (rows, vectors, ids)
+        return cached[1], cached[2]
+
+    def indexed_since(self, watermark: int) -> set[int]:
+        """Ids above `watermark` that are already indexed."""
+        indexed = set()
+        for segment in self._segments():
+            try:
+                _, ids = self._map(segment)
+            except FileNotFoundError:
+                continue
+            message_ids = ids["message_id"]
+            indexed.update(message_ids[message_ids > watermark].tolist())
+        return indexed
+
+    def watermark(self) -> int:
+        try:
+            with open(os.path.join(self.path, "watermark")) as f:
+                return int(f.read() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def append(self, vectors: np.ndarray, ids: np.ndarray, watermark: int):
+        """Add rows and record the last message id indexed, atomically with
+        respect to other writers."""
+        with self._locked():
+            segments = self._segments()
+            segment = segments[-1] if segments else 0
+            offset = 0
+            while offset < len(vectors):
+                rows = self._rows(segment) if segment in segments else 0
+                if rows >= MEMORY_SEGMENT_ROWS:
+                    segment += 1
+                    continue
+                take = min(MEMORY_SEGMENT_ROWS - rows, len(vectors) - offset)
+                # Vectors first: `.f32` makes a new segment visible, and a
+                # reader sizes a segment by its shorter file, so rows only
+                # count once their ids are written too.
+                with open(self._file(segment, ".f32"), "ab") as f:
+                    f.write(vectors[offset : offset + take].tobytes())
+                with open(self._file(segment, ".ids"), "ab") as f:
+                    f.write(ids[offset : offset + take].tobytes())
+                segments.append(segment)
+                offset += take
+
+            partial = os.path.join(self.path, "watermark.tmp")
+            with open(partial, "w") as f:
+                f.write(str(watermark))
+            os.replace(partial, os.path.join(self.path, "watermark"))
+
+    def compact(self):
+        """Merge the segments into one once there are too many."""
+        with self._locked():
+            segments = self._segments()
+            if len(segments) <= MEMORY_MAX_SEGMENTS:
+                return
+
+            vectors = np.concatenate([self._map(s)[0] for s in segments])
+            ids = np.concatenate([self._map(s)[1] for s in segments])
+            # Re-indexing after a restore can repeat ids; keep the newest row.
+            _, last = np.unique(ids["message_id"][::-1], return_index=True)
+            keep = np.sort(len(ids) - 1 - last)
+
+            # Written under a new number, after every segment it replaces, so
+            # a reader never maps a pair of files from different generations
+            # and segment order still follows insertion order. A search that
+            # lists both the old segments and the merged one only sees
+            # duplicates, which it already collapses by message id.
+            merged = segments[-1] + 1
+            for suffix, data in ((".ids", ids[keep]), (".f32", vectors[keep])):
+                partial = self._file(merged, suffix + ".tmp")
+                with open(partial, "wb") as f:
+                    f.write(data.tobytes())
+                # `.f32` last: it is what makes the segment visible.
+                os.replace(partial, self._file(merged, suffix))
+            for segment in segments:
+                for suffix in (".f32", ".ids"):
+                    os.remove(self._file(segment, suffix))
+            self._maps.clear()
+
+    def search(
+        self, query: np.ndarray, k: int, exclude=frozenset()
+    ) -> list[tuple[float, int, int]]:
+        """Top `k` rows by dot product with `query` (cosine, as rows are
+        normalised), as (score, message_id, chat_id)."""
+        best: dict[int, tuple[float, int, int]] = {}
+        segments = self._segments()
+        # Drop maps of segments another process merged away.
+        for segment in self._maps.keys() - set(segments):
+            self._maps.pop(segment, None)
+        for segment in segments:
+            try:
+                vectors, ids = self._map(segment)
+            except FileNotFoundError:
+                # Merged away since the listing, or new and without ids yet.
+                continue
+            if not len(ids):
+                continue
+            scores = vectors @ query
+            top = min(len(scores), k + len(exclude))
+            for i in np.argpartition(-scores, top - 1)[:top]:
+                message_id = int(ids[i]["message_id"])
+                if message_id in exclude:
+                    continue
+                hit = (float(scores[i]), message_id, int(ids[i]["chat_id"]))
+                if message_id not in best or best[message_id] < hit:
+                    best[message_id] = hit
+        return sorted(best.values(), reverse=True)[:k]
+
+
+_indexes: OrderedDict[int, MemoryIndex] = OrderedDict()
+_indexes_lock = Lock()
+
+
+def get_index(user_id: int, dim: int) -> MemoryIndex:
+    # Open indexes keep their memory maps, so repeat searches skip the
+    # open/mmap syscalls; the least recently used are closed past the cap.
+    with _indexes_lock:
+        index = _indexes.pop(user_id, None) or MemoryIndex(user_id, dim)
+        _indexes[user_id] = index
+        while len(_indexes) > MEMORY_OPEN_INDEXES:
+            _indexes.popitem(last=False)
+        return index
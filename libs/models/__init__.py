@@ -1,6 +1,7 @@
 from .base import Base
+from .branch_summary import BranchSummaries
 from .chat import Chats
-from .enums import SenderRole
+from .enums import MessageStatus, SenderRole
 from .message import Messages
 from .model import Models
 from .user import Users
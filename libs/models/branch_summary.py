@@ -0,0 +1,29 @@
+import datetime
+
+from sqlalchemy import DateTime, ForeignKey, Text, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+
+class BranchSummaries(Base):
+    """Summary of one branch, from the root down to `message_id`.
+
+    It covers exactly that message's ancestors, so it holds for every branch
+    continuing below it and never mentions a sibling; a turn uses the deepest
+    one on its own path.
+    """
+
+    __tablename__ = "branch_summaries"
+
+    # No foreign key to the partitioned messages table; compaction removes
+    # the summaries of messages it purges.
+    message_id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    chat_id: Mapped[int] = mapped_column(
+        ForeignKey("chats.id", ondelete="CASCADE"), index=True, nullable=False
+    )
+    summary: Mapped[str] = mapped_column(Text, nullable=False)
+
+    created_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
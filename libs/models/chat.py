@@ -1,6 +1,6 @@
 import datetime
 
-from sqlalchemy import DateTime, ForeignKey, String, Text, func
+from sqlalchemy import DateTime, ForeignKey, Index, String, Text, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .base import Base
@@ -15,7 +15,10 @@ class Chats(Base):
     )
 
     title: Mapped[str | None] = mapped_column(String(255))
+    # The most recently summarized branch, for listings and exports; prompts
+    # use the summary of their own branch, see BranchSummaries.
     summary: Mapped[str | None] = mapped_column(Text)
+    summarized_until_id: Mapped[int | None] = mapped_column(nullable=True)
 
     created_at: Mapped[datetime.datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), nullable=False
@@ -37,3 +40,13 @@ class Chats(Base):
         passive_deletes=True,
         order_by="Messages.created_at",
     )
+
+
+# Serves the sidebar's keyset pagination over a user's live chats.
+Index(
+    "ix_chats_user_updated",
+    Chats.user_id,
+    Chats.updated_at.desc(),
+    Chats.id.desc(),
+    postgresql_where=Chats.is_deleted == False,
+)
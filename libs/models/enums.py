@@ -5,3 +5,10 @@ class SenderRole(enum.Enum):
     user = "user"
     assistant = "assistant"
     system = "system"
+
+
+class MessageStatus(enum.Enum):
+    in_progress = "in_progress"
+    complete = "complete"
+    partial = "partial"
+    cancelled = "cancelled"
@@ -1,10 +1,28 @@
 import datetime
 
-from sqlalchemy import DateTime, Enum, ForeignKey, Index, String, Text, func
+from sqlalchemy import (
+    ARRAY,
+    Computed,
+    DateTime,
+    Enum,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+    func,
+    text,
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .base import Base
-from .enums import SenderRole
+from .enums import MessageStatus, SenderRole
+
+SEARCH_VECTOR = (
+    "CASE WHEN status <> 'in_progress'::messagestatus "
+    "THEN to_tsvector('english'::regconfig, content) END"
+)
 
 
 class Messages(Base):
@@ -14,6 +32,20 @@ class Messages(Base):
     chat_id: Mapped[int] = mapped_column(
         ForeignKey("chats.id", ondelete="CASCADE"), index=True, nullable=False
     )
+    # Copied from the chat, which never changes owner, so search can filter
+    # by user inside the GIN index instead of joining every match to chats.
+    user_id: Mapped[int] = mapped_column(nullable=False)
+
+    # Tree structure: `path` holds the ids of every ancestor from the root
+    # down to the parent, so a branch is loaded by primary key in one query.
+    # There is no foreign key: compaction clears dangling parents in small
+    # batches instead of ON DELETE SET NULL. `messages` is range-partitioned
+    # by id, so lookups by id prune to a single partition.
+    parent_id: Mapped[int | None] = mapped_column(index=True, nullable=True)
+    path: Mapped[list[int]] = mapped_column(
+        ARRAY(Integer), server_default=text("'{}'"), nullable=False
+    )
+    depth: Mapped[int] = mapped_column(default=0, server_default=text("0"))
 
     sender: Mapped[SenderRole] = mapped_column(
         Enum(SenderRole, native_enum=True), nullable=False
@@ -21,6 +53,26 @@ class Messages(Base):
 
     content_preview: Mapped[str | None] = mapped_column(String(500), nullable=True)
     content: Mapped[str] = mapped_column(Text, nullable=False)
+    # Maintained by Postgres once a reply is finished, so streaming appends
+    # do not re-tokenize it every flush. Deferred: loading a message never
+    # ships it.
+    search_vector: Mapped[str | None] = mapped_column(
+        TSVECTOR,
+        Computed(SEARCH_VECTOR, persisted=True),
+        deferred=True,
+    )
+    # SHA-256 hashes of attached images, see libs.media.
+    images: Mapped[list[str]] = mapped_column(
+        ARRAY(String(64)), server_default=text("'{}'"), nullable=False
+    )
+
+    status: Mapped[MessageStatus] = mapped_column(
+        Enum(MessageStatus, native_enum=True),
+        default=MessageStatus.complete,
+        server_default=MessageStatus.complete.value,
+        nullable=False,
+    )
+    completion_tokens: Mapped[int | None] = mapped_column(nullable=True)
 
     created_at: Mapped[datetime.datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), index=True
@@ -32,3 +84,16 @@ class Messages(Base):
 
 
 Index("ix_messages_chatid_created", Messages.chat_id, Messages.created_at)
+# Needs btree_gin for the integer column.
+Index(
+    "ix_messages_user_search",
+    Messages.user_id,
+    Messages.search_vector,
+    postgresql_using="gin",
+)
+# Only replies still streaming, so the stale-generation sweep stays cheap.
+Index(
+    "ix_messages_in_progress",
+    Messages.created_at,
+    postgresql_where=Messages.status == MessageStatus.in_progress,
+)
@@ -13,6 +13,13 @@ class SenderRole(str, Enum):
     system = "system"
 
 
+class MessageStatus(str, Enum):
+    in_progress = "in_progress"
+    complete = "complete"
+    partial = "partial"
+    cancelled = "cancelled"
+
+
 class OrmBase(BaseModel):
     """Base class for all Pydantic schemas, enables ORM mode"""
 
@@ -59,28 +66,72 @@ class ChatRead(OrmBase):
     user_id: int
     title: Optional[str]
     summary: Optional[str]
+    summarized_until_id: Optional[int]
     created_at: datetime.datetime
     updated_at: datetime.datetime
 
 
+class ChatPage(OrmBase):
+    items: List[ChatRead]
+    next_cursor: Optional[str]
+
+
 class ChatReadWithMessages(ChatRead):
     messages: List["MessageRead"]
 
 
 class MessageCreate(OrmBase):
     chat_id: int
+    parent_id: Optional[int] = None
     sender: SenderRole
     content: str
+    images: list[str] = Field(default_factory=list)
 
 
 class MessageRead(OrmBase):
     id: int
     chat_id: int
+    parent_id: Optional[int]
+    depth: int
     sender: SenderRole
     content: str
+    images: list[str]
+    status: MessageStatus
+    completion_tokens: Optional[int]
+    created_at: datetime.datetime
+
+
+class MessagePreview(OrmBase):
+    id: int
+    chat_id: int
+    parent_id: Optional[int]
+    depth: int
+    sender: SenderRole
+    content_preview: Optional[str]
+    images: list[str]
+    status: MessageStatus
     created_at: datetime.datetime
 
 
+class MessagePage(OrmBase):
+    items: List[MessagePreview]
+    next_cursor: Optional[str]
+
+
+class SearchHit(OrmBase):
+    id: int
+    chat_id: int
+    sender: SenderRole
+    created_at: datetime.datetime
+    rank: float
+    snippet: str
+
+
+class SearchPage(OrmBase):
+    items: List[SearchHit]
+    next_cursor: Optional[str]
+
+
 class ModelCreate(OrmBase):
     name: str
     params: dict[str, Any] = Field(default_factory=dict)
@@ -0,0 +1,17 @@
+from .metrics import (
+    ADMISSION_ACTIVE,
+    ADMISSION_WAITING,
+    AUTH_LOOKUP_SECONDS,
+    COMPLETION_TOKENS_TOTAL,
+    DB_WRITE_SECONDS,
+    HISTORY_CACHE_REQUESTS,
+    HISTORY_LOAD_SECONDS,
+    INTER_TOKEN_SECONDS,
+    PROMPT_TOKENS,
+    STREAM_DURATION_SECONDS,
+    SUMMARY_SECONDS,
+    TIME_TO_FIRST_TOKEN_SECONDS,
+    UPSTREAM_CONNECT_SECONDS,
+    track_admission,
+)
+from .tracing import setup_tracing, span, timed
@@ -0,0 +1,79 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Latency buckets in seconds, from sub-millisecond DB hits to long streams.
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160)
+GAP_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.02, 0.035, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+AUTH_LOOKUP_SECONDS = Histogram(
+    "auth_lookup_seconds",
+    "Time to resolve the bearer token to a user",
+    ["route", "source"],
+    buckets=FAST_BUCKETS,
+)
+HISTORY_LOAD_SECONDS = Histogram(
+    "history_load_seconds",
+    "Time to assemble the prompt context from history",
+    ["route", "model"],
+    buckets=FAST_BUCKETS,
+)
+DB_WRITE_SECONDS = Histogram(
+    "db_write_seconds",
+    "Time spent in chat DB writes",
+    ["route", "model", "operation"],
+    buckets=FAST_BUCKETS,
+)
+UPSTREAM_CONNECT_SECONDS = Histogram(
+    "upstream_connect_seconds",
+    "Time until the upstream returned response headers",
+    ["backend", "route", "model"],
+    buckets=FAST_BUCKETS + (5, 10),
+)
+TIME_TO_FIRST_TOKEN_SECONDS = Histogram(
+    "time_to_first_token_seconds",
+    "Time from sending the upstream request to the first streamed token",
+    ["route", "model"],
+    buckets=SLOW_BUCKETS,
+)
+INTER_TOKEN_SECONDS = Histogram(
+    "inter_token_seconds",
+    "Gap between consecutive streamed tokens",
+    ["route", "model"],
+    buckets=GAP_BUCKETS,
+)
+STREAM_DURATION_SECONDS = Histogram(
+    "stream_duration_seconds",
+    "Duration of a whole generation",
+    ["route", "model", "status"],
+    buckets=SLOW_BUCKETS,
+)
+PROMPT_TOKENS = Histogram(
+    "prompt_tokens",
+    "Prompt size in tokens after context assembly",
+    ["route", "model"],
+    buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768),
+)
+COMPLETION_TOKENS_TOTAL = Counter(
+    "completion_tokens_total",
+    "Tokens streamed back from the upstream",
+    ["route", "model", "status"],
+)
+HISTORY_CACHE_REQUESTS = Counter(
+    "history_cache_requests_total",
+    "Context assemblies by how much of the branch the Redis cache served",
+    ["result"],
+)
+SUMMARY_SECONDS = Histogram(
+    "summary_seconds",
+    "Latency of a summarization call",
+    ["model"],
+    buckets=SLOW_BUCKETS,
+)
+ADMISSION_ACTIVE = Gauge("admission_active", "Upstream requests holding a slot")
+ADMISSION_WAITING = Gauge("admission_waiting", "Requests queued for a slot")
+
+
+def track_admission(controller):
+    """Report an AdmissionController's slots through the admission gauges."""
+    ADMISSION_ACTIVE.set_function(lambda: controller.active)
+    ADMISSION_WAITING.set_function(lambda: controller.waiting)
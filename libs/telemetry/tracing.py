@@ -0,0 +1,71 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Spans are exported over OTLP/HTTP to this collector when it is set.
+OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "")
+
+# A proxy until setup_tracing installs a provider, and a no-op without one.
+tracer = trace.get_tracer("chat") if trace is not None else None
+
+
+def setup_tracing(service_name: str) -> bool:
+    """Install an SDK tracer provider that batches spans to the OTLP
+    endpoint. Needs the `tracing` extra and OTEL_EXPORTER_OTLP_ENDPOINT."""
+    if trace is None or not OTEL_EXPORTER_OTLP_ENDPOINT:
+        return False
+
+    try:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+            OTLPSpanExporter,
+        )
+        from opentelemetry.sdk.resources import SERVICE_NAME, Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        logger.warning(
+            "OTEL_EXPORTER_OTLP_ENDPOINT is set but the tracing extra is missing"
+        )
+        return False
+
+    provider = TracerProvider(resource=Resource.create({SERVICE_NAME: service_name}))
+    # The exporter reads the endpoint (and any OTEL_EXPORTER_OTLP_* options)
+    # from the environment itself.
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    return True
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """OpenTelemetry span when the SDK is installed, a no-op otherwise."""
+    if tracer is None:
+        yield None
+        return
+    # OTel rejects None attribute values, with a warning each time.
+    attributes = {key: value for key, value in attributes.items() if value is not None}
+    with tracer.start_as_current_span(name, attributes=attributes) as current:
+        yield current
+
+
+@contextmanager
+def timed(histogram, name: str, **labels):
+    """Observe the block's duration in `histogram` and wrap it in a span."""
+    started = time.perf_counter()
+    with span(name, **labels):
+        try:
+            yield
+        finally:
+            histogram.labels(**labels).observe(time.perf_counter() - started)
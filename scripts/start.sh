@@ -32,6 +32,7 @@ echo "Selected service: $SERVICE"
 STARTED_REDIS=false
 STARTED_BACKEND=false
 STARTED_FRONTEND=false
+STARTED_WORKER=false
 STARTED_VLLM=false
 
 echo "Checking dependencies..."
@@ -66,6 +67,7 @@ touch logs/logs_backend.txt
 touch logs/logs_frontend.txt
 touch logs/logs_redis.txt
 touch logs/logs_vllm.txt
+touch logs/logs_worker.txt
 
 if [ -f .env ]; then
   export $(grep -v '^#' .env | xargs)
@@ -94,6 +96,19 @@ if [[ "$SERVICE" == "backend" || "$SERVICE" == "all" ]]; then
   echo "Backend PID: $BACKEND_PID"
 fi
 
+if [[ "$SERVICE" == "worker" || "$SERVICE" == "all" ]]; then
+  echo "Starting worker..."
+  if [[ "$SERVICE" == "all" ]]; then
+    uv run python -m services.worker.main \
+        2>&1 | sed -u "s/\x1b\[[0-9;]*m//g" > logs/logs_worker.txt &
+  else
+    uv run python -m services.worker.main
+  fi
+  WORKER_PID=$!
+  STARTED_WORKER=true
+  echo "Worker PID: $WORKER_PID"
+fi
+
 if [[ "$SERVICE" == "frontend" || "$SERVICE" == "all" ]]; then
   echo "Starting frontend..."
   cd frontend
@@ -151,6 +166,7 @@ cleanup() {
 
   $STARTED_VLLM     && kill $VLLM_PID     2>/dev/null || true
   $STARTED_BACKEND  && kill $BACKEND_PID  2>/dev/null || true
+  $STARTED_WORKER   && kill $WORKER_PID   2>/dev/null || true
   $STARTED_FRONTEND && kill $FRONTEND_PID 2>/dev/null || true
   $STARTED_REDIS    && kill $REDIS_PID    2>/dev/null || true
 }
@@ -1,27 +1,71 @@
-from fastapi import Header, HTTPException
+import logging
+
+from fastapi import Header, HTTPException, Request
 from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
 
+from libs.auth.cache import cache_token, token_cache, user_cache
 from libs.auth.manager import AuthManager
-from libs.db import AsyncSessionLocal
+from libs.db import AsyncSessionLocal, ReadSessionLocal, engine, read_engine
 from libs.models import Users
+from libs.telemetry import AUTH_LOOKUP_SECONDS, timed
 
 auth = AuthManager()
 
+logger = logging.getLogger(__name__)
+
+
+async def load_user(sessionmaker, user_id: int):
+    async with sessionmaker() as db:
+        result = await db.execute(
+            select(Users).where(Users.id == user_id, Users.is_deleted == False)
+        )
+        return result.scalar_one_or_none()
+
+
+def route_template(request: Request) -> str:
+    """The request path with its parameters put back as placeholders, so ids
+    in the path don't each get their own metric series."""
+    route = request.url.path
+    for name, value in request.path_params.items():
+        route = route.replace(f"/{value}", f"/{{{name}}}", 1)
+    return route
 
-async def get_current_user(authorization: str = Header(None)):
+
+async def get_current_user(request: Request, authorization: str = Header(None)):
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(401, "Unauthorized")
 
     token = authorization.split(" ")[1]
-    payload = auth.verify_token(token)
-    if not payload:
-        raise HTTPException(401, "Invalid token")
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = auth.verify_token(token)
+        if not payload:
+            raise HTTPException(401, "Invalid token")
+        cache_token(token, payload)
+
+    user_id = int(payload["sub"])
+    route = route_template(request)
+    with timed(AUTH_LOOKUP_SECONDS, "auth_lookup", route=route, source="cache"):
+        user = user_cache.get(user_id)
+    if user is not None:
+        return user
 
-    async with AsyncSessionLocal() as db:
-        result = await db.execute(select(Users).where(Users.id == int(payload["sub"])))
-        user = result.scalar_one_or_none()
+    with timed(AUTH_LOOKUP_SECONDS, "auth_lookup", route=route, source="db"):
+        try:
+            user = await load_user(ReadSessionLocal, user_id)
+        except (SQLAlchemyError, OSError):
+            if read_engine is engine:
+                raise
+            logger.warning("replica user lookup failed", exc_info=True)
+            user = None
+        # A token issued at signup can arrive before the replica has the
+        # user; a miss there is only final once the primary agrees.
+        if user is None and read_engine is not engine:
+            user = await load_user(AsyncSessionLocal, user_id)
 
-        if not user:
-            raise HTTPException(401, "User not found")
+    if not user:
+        raise HTTPException(401, "User not found")
 
-        return user
+    user_cache.set(user_id, user)
+    return user
@@ -1,14 +1,42 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from libs.auth.cache import listen_for_invalidations
+from libs.cache import redis_client
+from libs.llm import UpstreamPool, create_upstream_client, get_tokenizer
+from libs.media import shutdown_media
+from libs.telemetry import setup_tracing
 from services.api.src.routes.auth import router as auth_router
+from services.api.src.routes.chat import engine as chat_engine
 from services.api.src.routes.chat import router as chat_router
+from services.api.src.routes.media import router as media_router
+from services.api.src.routes.metrics import router as metrics_router
 
 load_dotenv()
 
+setup_tracing("chat-api")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    chat_engine.upstream = UpstreamPool(create_upstream_client())
+    chat_engine.upstream.start()
+    await asyncio.to_thread(get_tokenizer)
+    invalidations = asyncio.create_task(listen_for_invalidations())
+    cancellations = asyncio.create_task(chat_engine.listen_for_cancellations())
+    yield
+    invalidations.cancel()
+    cancellations.cancel()
+    await chat_engine.aclose()
+    shutdown_media()
+    await redis_client.aclose()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,6 +48,8 @@ app.add_middleware(
 
 app.include_router(auth_router, prefix="/auth")
 app.include_router(chat_router, prefix="/chat")
+app.include_router(media_router, prefix="/media")
+app.include_router(metrics_router, prefix="/metrics")
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import JSONResponse
 from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 
 from libs.auth.hashing import hash_password
 from libs.auth.manager import AuthManager
@@ -29,18 +30,21 @@ async def signup(payload: dict):
     email = payload["email"]
     password = payload["password"]
 
+    # Sessions are kept to the queries: hashing runs with no pooled
+    # connection checked out.
     async with AsyncSessionLocal() as db:
-        result = await db.execute(select(Users).where(Users.email == email))
-        existing = result.scalar_one_or_none()
-        if existing:
+        result = await db.execute(select(Users.id).where(Users.email == email))
+        if result.first() is not None:
             raise HTTPException(400, "User already exists")
 
-        user = Users(
-            email=email,
-            password_hash=hash_password(password),
-        )
+    user = Users(email=email, password_hash=await hash_password(password))
+    async with AsyncSessionLocal() as db:
         db.add(user)
-        await db.commit()
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Signed up concurrently while the password was being hashed.
+            raise HTTPException(400, "User already exists")
         await db.refresh(user)
 
     token = auth.create_token(user)
@@ -1,13 +1,24 @@
-from fastapi import APIRouter, Depends, Request
-from libs.db import AsyncSessionLocal
-from libs.models import Chats
-from sqlalchemy import select
+import datetime
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from libs.cache import stream_exists
+from libs.models import MessageStatus
+from libs.models.pydantic_models import (
+    ChatPage,
+    MessagePage,
+    MessageRead,
+    SearchPage,
+)
 
 from ..deps import get_current_user
+from .chat_archive import ChatArchive
 from .chat_engine import ChatEngine
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, page
 
 router = APIRouter()
 engine = ChatEngine()
+archive = ChatArchive()
 
 
 @router.options("/send")
@@ -20,15 +31,193 @@ async def chat(request: Request, user=Depends(get_current_user)):
     body = await request.json()
     user_msg = body.get("message", "") or ""
     images = body.get("images", []) or []
-    return await engine.handle_chat(user_msg, images)
+    chat_id = body.get("chat_id")
+    if chat_id is not None and type(chat_id) is not int:
+        raise HTTPException(400, "chat_id must be an integer")
+    parent_id = body.get("parent_id")
+    if parent_id is not None and type(parent_id) is not int:
+        raise HTTPException(400, "parent_id must be an integer")
+    return await engine.handle_chat(
+        user.id,
+        user_msg,
+        images,
+        chat_id,
+        parent_id,
+        coalesce_ms=body.get("coalesce_ms"),
+        coalesce_tokens=body.get("coalesce_tokens"),
+        request=request,
+        new_chat=bool(body.get("new_chat")),
+        branches=body.get("n", 1),
+    )
+
+
+@router.post("/fork")
+async def fork(request: Request, user=Depends(get_current_user)):
+    body = await request.json()
+    message_id = body.get("message_id")
+    if message_id is None:
+        raise HTTPException(400, "message_id is required")
+    if type(message_id) is not int:
+        raise HTTPException(400, "message_id must be an integer")
+    user_msg = body.get("message", "") or ""
+    images = body.get("images", []) or []
+    return await engine.handle_chat(
+        user.id,
+        user_msg,
+        images,
+        parent_id=message_id,
+        request=request,
+        branches=body.get("n", 1),
+    )
+
+
+@router.post("/cancel")
+async def cancel(request: Request, user=Depends(get_current_user)):
+    body = await request.json()
+    generation_id = body.get("generation_id")
+    if generation_id is None:
+        raise HTTPException(400, "generation_id is required")
+    if type(generation_id) is not int:
+        raise HTTPException(400, "generation_id must be an integer")
+
+    async with engine.chat_service.unit_of_work() as db:
+        message = await engine.chat_service.get_user_message(db, user.id, generation_id)
+        if message is None:
+            raise HTTPException(404, "Generation not found")
+
+    # A reply is only in_progress while some API process is generating it.
+    if message.status != MessageStatus.in_progress:
+        return {"generation_id": generation_id, "cancelled": False}
+    await engine.request_cancel(generation_id)
+    return {"generation_id": generation_id, "cancelled": True}
+
+
+@router.get("/branch/{message_id}", response_model=list[MessageRead])
+async def branch(message_id: int, user=Depends(get_current_user)):
+    # On the primary: clients fetch a branch right after creating its tip.
+    async with engine.chat_service.unit_of_work() as db:
+        tip = await engine.chat_service.get_user_message(db, user.id, message_id)
+        if tip is None:
+            raise HTTPException(404, "Message not found")
+        return await engine.chat_service.get_branch(db, tip.id)
+
+
+@router.delete("/message/{message_id}")
+async def delete_message(message_id: int, user=Depends(get_current_user)):
+    async with engine.chat_service.unit_of_work() as db:
+        message = await engine.chat_service.get_user_message(db, user.id, message_id)
+        if message is None:
+            raise HTTPException(404, "Message not found")
+        await engine.chat_service.delete_message(db, message)
+    return {"message_id": message_id, "deleted": True}
+
 
+@router.delete("/{chat_id}")
+async def delete_chat(chat_id: int, user=Depends(get_current_user)):
+    async with engine.chat_service.unit_of_work() as db:
+        if not await engine.chat_service.delete_chat(db, user.id, chat_id):
+            raise HTTPException(404, "Chat not found")
+    return {"chat_id": chat_id, "deleted": True}
 
-@router.post("/all")
-async def chats(user=Depends(get_current_user)):
-    async with AsyncSessionLocal() as db:
-        result = await db.execute(
-            select(Chats).where(Chats.user_id == user.id, Chats.is_deleted.is_(False))
+
+@router.get("/stream/{message_id}")
+async def stream(
+    request: Request,
+    message_id: int,
+    offset: str = "0",
+    last_event_id: str | None = Header(None),
+    user=Depends(get_current_user),
+):
+    async with engine.chat_service.unit_of_work() as db:
+        if await engine.chat_service.get_user_message(db, user.id, message_id) is None:
+            raise HTTPException(404, "Message not found")
+        message = await engine.chat_service.get_message(db, message_id)
+
+    if not await stream_exists(message_id):
+        return StreamingResponse(
+            engine.replay_stored(message), media_type="text/event-stream"
+        )
+
+    return StreamingResponse(
+        engine.subscribe(message_id, last_event_id or offset, request),
+        media_type="text/event-stream",
+    )
+
+
+@router.api_route("/all", methods=["GET", "POST"], response_model=ChatPage)
+async def chats(
+    cursor: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    user=Depends(get_current_user),
+):
+    after = decode_cursor(cursor, datetime.datetime, int) if cursor else None
+    async with engine.chat_service.read_only() as db:
+        rows = await engine.chat_service.list_chats(db, user.id, limit + 1, after)
+    items, next_cursor = page(rows, limit, lambda r: (r.updated_at, r.id))
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@router.get("/search", response_model=SearchPage)
+async def search(
+    q: str = Query(..., min_length=1, max_length=256),
+    cursor: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    user=Depends(get_current_user),
+):
+    after = decode_cursor(cursor, float, int) if cursor else None
+    async with engine.chat_service.read_only() as db:
+        rows = await engine.chat_service.search_messages(
+            db, user.id, q, limit + 1, after
         )
-        chats = result.scalar_one_or_none()
+    items, next_cursor = page(rows, limit, lambda r: (r.rank, r.id))
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@router.get("/{chat_id}/messages", response_model=MessagePage)
+async def messages(
+    chat_id: int,
+    cursor: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    user=Depends(get_current_user),
+):
+    before = decode_cursor(cursor, datetime.datetime, int) if cursor else None
+    async with engine.chat_service.read_only() as db:
+        chat = await engine.chat_service.get_or_create_chat(db, user.id, chat_id)
+        if chat is not None:
+            rows = await engine.chat_service.list_messages(
+                db, chat_id, limit + 1, before
+            )
+    if chat is None:
+        # The replica may not have a chat created moments ago yet.
+        async with engine.chat_service.unit_of_work() as db:
+            chat = await engine.chat_service.get_or_create_chat(db, user.id, chat_id)
+            if chat is None:
+                raise HTTPException(404, "Chat not found")
+            rows = await engine.chat_service.list_messages(
+                db, chat_id, limit + 1, before
+            )
+    items, next_cursor = page(rows, limit, lambda r: (r.created_at, r.id))
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@router.get("/message/{message_id}", response_model=MessageRead)
+async def message(message_id: int, user=Depends(get_current_user)):
+    # On the primary, like /branch: the message is often brand new.
+    async with engine.chat_service.unit_of_work() as db:
+        if await engine.chat_service.get_user_message(db, user.id, message_id) is None:
+            raise HTTPException(404, "Message not found")
+        return await engine.chat_service.get_message(db, message_id)
+
+
+@router.get("/export")
+async def export(user=Depends(get_current_user)):
+    return StreamingResponse(
+        archive.export_ndjson(user.id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="chats.ndjson"'},
+    )
+
 
-        return chats
+@router.post("/import")
+async def import_chats(request: Request, user=Depends(get_current_user)):
+    return await archive.import_ndjson(user.id, request.stream())
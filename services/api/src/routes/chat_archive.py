@@ -0,0 +1,241 @@
+import datetime
+import os
+from typing import AsyncIterator
+
+import orjson
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from sqlalchemy import bindparam, func, insert, select, update
+
+from libs.db import AsyncSessionLocal, ReadSessionLocal
+from libs.models import BranchSummaries, Chats, Messages, MessageStatus, SenderRole
+
+from .chat_service import CONTENT_PREVIEW_LENGTH
+
+load_dotenv()
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+
+CHAT_COLUMNS = (
+    Chats.id,
+    Chats.title,
+    Chats.summary,
+    Chats.summarized_until_id,
+    Chats.created_at,
+    Chats.updated_at,
+)
+MESSAGE_COLUMNS = (
+    Messages.id,
+    Messages.chat_id,
+    Messages.parent_id,
+    Messages.path,
+    Messages.sender,
+    Messages.content,
+    Messages.images,
+    Messages.status,
+    Messages.completion_tokens,
+    Messages.created_at,
+)
+
+
+async def _lines(chunks: AsyncIterator[bytes]):
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+
+def _record(kind: str, row) -> bytes:
+    return orjson.dumps(
+        {"type": kind, **row._mapping}, option=orjson.OPT_APPEND_NEWLINE
+    )
+
+
+def _timestamps(record: dict, *keys) -> dict:
+    # Missing timestamps are left to the server defaults.
+    return {
+        key: datetime.datetime.fromisoformat(record[key])
+        for key in keys
+        if record.get(key)
+    }
+
+
+class ChatArchive:
+    """NDJSON export and import of a user's chats.
+
+    The format is one `chat` record per chat followed by one `message` record
+    per message, in id order so a parent always comes before its children.
+    Both directions work a batch at a time and never hold a whole history.
+    """
+
+    async def export_ndjson(self, user_id: int):
+        async with ReadSessionLocal() as db:
+            # One snapshot for both queries, so a chat created in between
+            # cannot have its messages exported without its chat record.
+            await db.connection(
+                execution_options={"isolation_level": "REPEATABLE READ"}
+            )
+            chats = await db.stream(
+                select(*CHAT_COLUMNS)
+                .where(Chats.user_id == user_id, Chats.is_deleted == False)
+                .order_by(Chats.id)
+                .execution_options(yield_per=EXPORT_BATCH_SIZE)
+            )
+            async for rows in chats.partitions():
+                yield b"".join(_record("chat", row) for row in rows)
+
+            messages = await db.stream(
+                select(*MESSAGE_COLUMNS)
+                .join(Chats, Chats.id == Messages.chat_id)
+                .where(
+                    Chats.user_id == user_id,
+                    Chats.is_deleted == False,
+                    Messages.is_deleted == False,
+                )
+                .order_by(Messages.id)
+                .execution_options(yield_per=EXPORT_BATCH_SIZE)
+            )
+            async for rows in messages.partitions():
+                yield b"".join(_record("message", row) for row in rows)
+
+    async def _allocate_ids(self, db, table: str, count: int) -> list[int]:
+        # Ids are drawn from the table's sequence up front so children in
+        # the same batch can point at their parents before anything is sent.
+        result = await db.execute(
+            select(func.nextval(func.pg_get_serial_sequence(table, "id"))).select_from(
+                func.generate_series(1, count)
+            )
+        )
+        return list(result.scalars())
+
+    async def import_ndjson(self, user_id: int, chunks: AsyncIterator[bytes]) -> dict:
+        chat_ids: dict[int, int] = {}
+        message_ids: dict[int, int] = {}
+        watermarks: dict[int, int] = {}
+        chats, messages = [], []
+
+        async def flush_chats():
+            new_ids = await self._allocate_ids(db, "chats", len(chats))
+            rows = []
+            for record, new_id in zip(chats, new_ids):
+                chat_ids[record["id"]] = new_id
+                if record.get("summarized_until_id") is not None:
+                    watermarks[new_id] = (
+                        record["summarized_until_id"],
+                        record.get("summary"),
+                    )
+                rows.append(
+                    {
+                        "id": new_id,
+                        "user_id": user_id,
+                        "title": record.get("title"),
+                        "summary": record.get("summary"),
+                        **_timestamps(record, "created_at", "updated_at"),
+                    }
+                )
+            await db.execute(insert(Chats), rows)
+            chats.clear()
+
+        async def flush_messages():
+            new_ids = await self._allocate_ids(db, "messages", len(messages))
+            rows = []
+            for record, new_id in zip(messages, new_ids):
+                message_ids[record["id"]] = new_id
+                if record["chat_id"] not in chat_ids:
+                    raise HTTPException(400, f"Unknown chat {record['chat_id']}")
+                # Ancestors that were not exported (deleted) are dropped.
+                path = [
+                    message_ids[i]
+                    for i in record.get("path") or []
+                    if i in message_ids
+                ]
+                status = MessageStatus(record.get("status", "complete"))
+                content = record.get("content") or ""
+                images = record.get("images") or []
+                if not isinstance(images, list) or not all(
+                    isinstance(h, str) for h in images
+                ):
+                    raise ValueError("images must be a list of hashes")
+                rows.append(
+                    {
+                        "id": new_id,
+                        "chat_id": chat_ids[record["chat_id"]],
+                        "user_id": user_id,
+                        "parent_id": message_ids.get(record.get("parent_id")),
+                        "path": path,
+                        "depth": len(path),
+                        "sender": SenderRole(record["sender"]),
+                        "content": content,
+                        "content_preview": content[:CONTENT_PREVIEW_LENGTH],
+                        "images": images,
+                        "status": MessageStatus.partial
+                        if status == MessageStatus.in_progress
+                        else status,
+                        "completion_tokens": record.get("completion_tokens"),
+                        **_timestamps(record, "created_at"),
+                    }
+                )
+            await db.execute(insert(Messages), rows)
+            messages.clear()
+
+        # One transaction: an import either lands completely or not at all.
+        async with AsyncSessionLocal() as db:
+            try:
+                async for line in _lines(chunks):
+                    record = orjson.loads(line)
+                    if not isinstance(record, dict):
+                        raise HTTPException(400, "Invalid archive: expected objects")
+                    if record.get("type") == "chat":
+                        chats.append(record)
+                        if len(chats) >= IMPORT_BATCH_SIZE:
+                            await flush_chats()
+                    elif record.get("type") == "message":
+                        if chats:
+                            await flush_chats()
+                        messages.append(record)
+                        if len(messages) >= IMPORT_BATCH_SIZE:
+                            await flush_messages()
+                    else:
+                        raise HTTPException(400, "Unknown record type")
+                if chats:
+                    await flush_chats()
+                if messages:
+                    await flush_messages()
+            except (orjson.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+                raise HTTPException(400, f"Invalid archive: {e}")
+
+            # Summary watermarks point at messages, so they are remapped
+            # once every message has its new id.
+            watermark_rows, summary_rows = [], []
+            for chat_id, (old, summary) in watermarks.items():
+                if old not in message_ids:
+                    continue
+                watermark_rows.append({"chat_id": chat_id, "until": message_ids[old]})
+                # The chat's summary is that of the branch it ends on.
+                if summary:
+                    summary_rows.append(
+                        {
+                            "message_id": message_ids[old],
+                            "chat_id": chat_id,
+                            "summary": summary,
+                        }
+                    )
+            if watermark_rows:
+                conn = await db.connection()
+                await conn.execute(
+                    update(Chats.__table__)
+                    .where(Chats.__table__.c.id == bindparam("chat_id"))
+                    .values(summarized_until_id=bindparam("until")),
+                    watermark_rows,
+                )
+            if summary_rows:
+                await db.execute(insert(BranchSummaries), summary_rows)
+            await db.commit()
+
+        return {"chats": len(chat_ids), "messages": len(message_ids)}
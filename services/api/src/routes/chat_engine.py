@@ -1,129 +1,561 @@
-import json
+import asyncio
+import logging
 import os
+import time
 
-import httpx
+import orjson
 from dotenv import load_dotenv
+from fastapi import HTTPException
 from fastapi.responses import StreamingResponse
 
+from libs.cache import (
+    GENERATION_CANCEL_CHANNEL,
+    add_viewer,
+    close_stream,
+    count_viewers,
+    open_stream,
+    publish_token,
+    read_stream,
+    read_streams,
+    redis_client,
+    remove_viewer,
+)
+from libs.jobs import enqueue_summary
+from libs.llm import (
+    MODEL,
+    AdmissionController,
+    AdmissionRejected,
+    UpstreamPool,
+    iter_choice_deltas,
+    sse_frame,
+)
+from libs.media import image_exists, image_note
+from libs.models import MessageStatus
+from libs.telemetry import (
+    COMPLETION_TOKENS_TOTAL,
+    DB_WRITE_SECONDS,
+    HISTORY_LOAD_SECONDS,
+    INTER_TOKEN_SECONDS,
+    PROMPT_TOKENS,
+    STREAM_DURATION_SECONDS,
+    TIME_TO_FIRST_TOKEN_SECONDS,
+    span,
+    timed,
+    track_admission,
+)
 from services.api.src.routes.chat_service import ChatService
+from services.api.src.routes.context_builder import REPLY_TOKEN_RESERVE, ContextBuilder
 
 load_dotenv()
 
-MODEL = os.getenv("CHAT_MODEL")
-VLLM_URL = "http://localhost:8000/v1/chat/completions"
-WINDOW_SIZE = int(os.getenv("WINDOW_SIZE", "4"))
 SYSTEM_PROMPT_TEMPLATE = os.getenv("SYSTEM_PROMPT", "")
-MODEL_TEMPERATURE = os.getenv("MODEL_TEMPERATURE")
+STREAM_FLUSH_TOKENS = int(os.getenv("STREAM_FLUSH_TOKENS", "64"))
+STREAM_FLUSH_INTERVAL = int(os.getenv("STREAM_FLUSH_INTERVAL_MS", "1000")) / 1000
+STREAM_COALESCE_MS = int(os.getenv("STREAM_COALESCE_MS", "0"))
+STREAM_COALESCE_TOKENS = int(os.getenv("STREAM_COALESCE_TOKENS", "0"))
+CANCEL_ON_DISCONNECT = os.getenv("CANCEL_ON_DISCONNECT", "true").lower() == "true"
+# Time a generation may run with nobody watching, so a reconnecting client
+# can pick it back up before it is cancelled.
+DISCONNECT_GRACE_SECONDS = float(os.getenv("DISCONNECT_GRACE_SECONDS", "5"))
+# Longest a token waits in a count-only coalescing buffer when the upstream
+# stalls; with STREAM_COALESCE_MS set, that interval is the limit instead.
+STREAM_STALL_FLUSH = int(os.getenv("STREAM_STALL_FLUSH_MS", "200")) / 1000
+# Upper bound on the alternatives one /chat/send may ask for with `n`.
+CHAT_MAX_BRANCHES = int(os.getenv("CHAT_MAX_BRANCHES", "4"))
+
+logger = logging.getLogger(__name__)
+
+
+def stream_frames(entries, **tags):
+    """SSE frames for a batch of stream entries, and whether the batch ended
+    the stream. Consecutive tokens are merged into a single frame whose id is
+    the last entry, so resuming from it stays exact."""
+    frames = []
+    tokens = []
+    last_id = None
+    done = False
+    for entry_id, fields in entries:
+        if "token" in fields:
+            tokens.append(fields["token"])
+            last_id = entry_id
+            continue
+        if tokens:
+            frames.append(sse_frame({**tags, "token": "".join(tokens)}, last_id))
+            tokens = []
+        if "meta" in fields:
+            frames.append(sse_frame(fields["meta"], entry_id))
+        else:
+            done = True
+            frames.append(sse_frame({**tags, "done": fields["done"]}, entry_id))
+    if tokens:
+        frames.append(sse_frame({**tags, "token": "".join(tokens)}, last_id))
+    return frames, done
+
+
+class _Branch:
+    """Progress of one of the alternatives a generation streams."""
+
+    def __init__(self, reply, now):
+        self.reply = reply
+        self.pending = []
+        self.buffered = []
+        self.generated = 0
+        self.last_flush = self.last_token = now
+        self.last_publish = 0.0
+        # Publishes come from the stream loop and the stall flusher; the
+        # lock keeps their entries in order.
+        self.publish_lock = asyncio.Lock()
+
+    def publish_due(self, now, interval, tokens):
+        if not self.last_publish:
+            return True  # the first token is never held
+        if tokens and len(self.buffered) >= tokens:
+            return True
+        if interval:
+            return now - self.last_publish >= interval
+        return not tokens
+
+    async def publish(self):
+        async with self.publish_lock:
+            if not self.buffered:
+                return
+            chunk = "".join(self.buffered)
+            self.buffered.clear()
+            self.last_publish = time.monotonic()
+            await publish_token(self.reply.id, chunk)
+
+
+async def _flush_stalled(branches, period, stopped):
+    # Publishes what a branch has buffered once it has waited `period`, so
+    # an upstream pause does not hold back tokens already generated.
+    while True:
+        try:
+            await asyncio.wait_for(stopped.wait(), period)
+            return
+        except asyncio.TimeoutError:
+            pass
+        now = time.monotonic()
+        for branch in branches:
+            if branch.buffered and now - branch.last_publish >= period:
+                await branch.publish()
 
 
 class ChatEngine:
     def __init__(self):
-        self.summary = ""
         self.chat_service = ChatService()
+        self.context_builder = ContextBuilder(self.chat_service)
+        self.upstream: UpstreamPool | None = None
+        self.generations: dict[int, asyncio.Task] = {}
+        self.admission = AdmissionController()
+        track_admission(self.admission)
+        self.cancel_requested: set[int] = set()
+        self.watchdogs: set[asyncio.Task] = set()
 
-    async def load_history(self, chat_id):
-        msgs = await self.chat_service.get_recent_messages(chat_id, WINDOW_SIZE)
-        history = []
-        for m in msgs:
-            history.append({"role": m.sender.value, "content": m.content})
-        return history
-
-    async def summarize_history(self, history):
-        dialog_text = "\n".join(f"{m['role'].upper()}: {m['content']}" for m in history)
-
-        user_prompt = (
-            "Update the persistent conversation summary.\n\n"
-            "Rules:\n"
-            "- Keep user facts, preferences, goals.\n"
-            "- Remove chit-chat.\n"
-            "- Keep it short, accurate, factual.\n"
-            "- Never contradict previous summary.\n\n"
-            f"PREVIOUS SUMMARY:\n{self.summary or '(empty)'}\n\n"
-            f"NEW DIALOG:\n{dialog_text}\n\n"
-            "UPDATED SUMMARY:"
-        )
+    async def prepare_turn(
+        self,
+        user_id,
+        content,
+        chat_id=None,
+        parent_id=None,
+        new_chat=False,
+        route="/chat/send",
+        images=(),
+        branches=1,
+    ):
+        async with self.chat_service.unit_of_work() as db:
+            if parent_id is not None:
+                parent = await self.chat_service.get_user_message(db, user_id, parent_id)
+                if parent is None:
+                    raise HTTPException(404, "Message not found")
+                chat_id = parent.chat_id
 
-        async with httpx.AsyncClient(timeout=None) as client:
-            r = await client.post(
-                VLLM_URL,
-                json={
-                    "model": MODEL,
-                    "messages": [
-                        {"role": "system", "content": "You are a memory engine."},
-                        {"role": "user", "content": user_prompt},
-                    ],
-                    "stream": False,
-                    "temperature": MODEL_TEMPERATURE,
-                },
+            chat = await self.chat_service.get_or_create_chat(
+                db, user_id, chat_id, new_chat and parent_id is None
             )
+            if chat is None:
+                raise HTTPException(404, "Chat not found")
 
-        resp = r.json()
-        print(resp)
-        return resp["choices"][0]["message"]["content"].strip()
+            if parent_id is None:
+                parent = await self.chat_service.get_latest_message(db, chat.id)
 
-    async def handle_chat(self, user_msg, images):
-        chat = await self.chat_service.get_or_create_chat()
+            system_messages = [{"role": "system", "content": SYSTEM_PROMPT_TEMPLATE}]
+            # Only the summary of the branch being continued: other branches
+            # and sibling alternatives are not part of this conversation.
+            summary = await self.chat_service.get_branch_summary(db, parent)
+            if summary is not None and summary.summary:
+                system_messages.append(
+                    {"role": "system", "content": f"### MEMORY\n{summary.summary}\n"}
+                )
+            recalled = await self.context_builder.recall(
+                db,
+                user_id,
+                summary.message_id if summary is not None else 0,
+                parent,
+                content,
+            )
+            if recalled:
+                system_messages.append({"role": "system", "content": recalled})
 
-        history = await self.load_history(chat.id)
+            with timed(
+                HISTORY_LOAD_SECONDS, "history_load", route=route, model=MODEL
+            ):
+                messages, prompt_tokens = await self.context_builder.build(
+                    db,
+                    parent,
+                    system_messages,
+                    {"role": "user", "content": content + image_note(images)},
+                )
+            PROMPT_TOKENS.labels(route=route, model=MODEL).observe(prompt_tokens)
 
-        content = user_msg
-        if images:
-            content += "\n[User sent images: " + ", ".join(images) + "]"
+            with timed(
+                DB_WRITE_SECONDS,
+                "db_write",
+                route=route,
+                model=MODEL,
+                operation="turn_start",
+            ):
+                user_message = await self.chat_service.add_user_message(
+                    db, chat.id, user_id, content, parent, images
+                )
+                replies = await self.chat_service.start_assistant_messages(
+                    db, chat.id, user_id, user_message, branches
+                )
+                await self.chat_service.commit_turn(db, chat.id, user_message)
 
-        await self.chat_service.add_user_message(chat.id, content)
+        return chat, user_message, replies, messages
 
-        history.append({"role": "user", "content": content})
+    async def handle_chat(
+        self,
+        user_id,
+        user_msg,
+        images,
+        chat_id=None,
+        parent_id=None,
+        coalesce_ms=None,
+        coalesce_tokens=None,
+        request=None,
+        new_chat=False,
+        branches=1,
+    ):
+        route = request.url.path if request is not None else "/chat/send"
+        # Images are uploaded to /media first and referenced by hash.
+        if not all(isinstance(h, str) and image_exists(h) for h in images):
+            raise HTTPException(400, "Unknown image")
+        if type(branches) is not int or not 1 <= branches <= CHAT_MAX_BRANCHES:
+            raise HTTPException(400, f"n must be between 1 and {CHAT_MAX_BRANCHES}")
+        for name, value in (
+            ("coalesce_ms", coalesce_ms),
+            ("coalesce_tokens", coalesce_tokens),
+        ):
+            if value is not None and (type(value) is not int or value < 0):
+                raise HTTPException(400, f"{name} must be a non-negative integer")
 
-        messages = []
-        messages.append({"role": "system", "content": SYSTEM_PROMPT_TEMPLATE})
+        try:
+            await self.admission.acquire(user_id)
+        except AdmissionRejected as e:
+            raise HTTPException(
+                429, "Too many requests", headers={"Retry-After": str(e.retry_after)}
+            )
+        admitted_at = time.monotonic()
 
-        if self.summary:
-            messages.append(
-                {"role": "system", "content": f"### MEMORY\n{self.summary}\n"}
+        try:
+            chat, user_message, replies, messages = await self.prepare_turn(
+                user_id, user_msg, chat_id, parent_id, new_chat, route, images, branches
             )
+            db_ms = (time.monotonic() - admitted_at) * 1000
+            for i, reply in enumerate(replies):
+                meta = {
+                    "chat_id": chat.id,
+                    "user_message_id": user_message.id,
+                    "message_id": reply.id,
+                }
+                if branches > 1:
+                    meta["branch"] = i
+                await open_stream(reply.id, orjson.dumps(meta))
+        except BaseException:
+            self.admission.release()
+            raise
 
-        window = history[-WINDOW_SIZE:]
-        messages.extend(window)
+        self.start_generation(
+            chat.id,
+            replies,
+            messages,
+            admitted_at,
+            STREAM_COALESCE_MS if coalesce_ms is None else coalesce_ms,
+            STREAM_COALESCE_TOKENS if coalesce_tokens is None else coalesce_tokens,
+            route,
+        )
 
+        if branches > 1:
+            frames = self.subscribe_branches([reply.id for reply in replies], request)
+        else:
+            frames = self.subscribe(replies[0].id, request=request)
         return StreamingResponse(
-            self.stream_vllm(chat.id, messages),
+            frames,
             media_type="text/event-stream",
+            headers={"Server-Timing": f"db;dur={db_ms:.1f}"},
+        )
+
+    def start_generation(
+        self,
+        chat_id,
+        replies,
+        messages,
+        admitted_at,
+        coalesce_ms,
+        coalesce_tokens,
+        route,
+    ):
+        # The generation is owned by the process, not by the request that
+        # started it: every viewer reads the same Redis stream. It holds the
+        # admission slot taken in handle_chat until it finishes. All the
+        # alternatives share one upstream request, so they share the task.
+        task = asyncio.create_task(
+            self.stream_vllm(
+                chat_id, replies, messages, coalesce_ms, coalesce_tokens, route
+            )
         )
+        for reply in replies:
+            self.generations[reply.id] = task
+
+        def finished(_):
+            for reply in replies:
+                self.generations.pop(reply.id, None)
+                self.cancel_requested.discard(reply.id)
+            self.admission.release(time.monotonic() - admitted_at)
+
+        task.add_done_callback(finished)
+
+    async def subscribe(self, message_id, offset="0", request=None):
+        await add_viewer(message_id)
+        done = False
+        try:
+            async for entries in read_stream(message_id, offset):
+                if request is not None and await request.is_disconnected():
+                    return
+                frames, done = stream_frames(entries)
+                for frame in frames:
+                    yield frame
+        finally:
+            self.leave_soon([(message_id, done)])
+
+    async def subscribe_branches(self, message_ids, request=None):
+        # Every alternative is multiplexed onto this one connection, tagged
+        # with its branch index; each can still be resumed on its own from
+        # /chat/stream/{message_id}.
+        branch = {message_id: i for i, message_id in enumerate(message_ids)}
+        done = set()
+        for message_id in message_ids:
+            await add_viewer(message_id)
+        try:
+            async for batch in read_streams(message_ids):
+                if request is not None and await request.is_disconnected():
+                    return
+                for message_id, entries in batch:
+                    frames, finished = stream_frames(
+                        entries, branch=branch[message_id]
+                    )
+                    if finished:
+                        done.add(message_id)
+                    for frame in frames:
+                        yield frame
+        finally:
+            self.leave_soon(
+                [(message_id, message_id in done) for message_id in message_ids]
+            )
 
-    async def stream_vllm(self, chat_id, messages):
-        async with httpx.AsyncClient(timeout=None) as client:
-            async with client.stream(
-                "POST",
-                VLLM_URL,
-                json={"model": MODEL, "messages": messages, "stream": True},
-            ) as r:
-                assistant_reply = ""
+    def leave_soon(self, departures):
+        # Scheduled, not awaited: on a disconnect the server cancels the
+        # response, and an await in the generator's `finally` would be
+        # cancelled with it, leaving the viewer counted and no watchdog set.
+        task = asyncio.create_task(self.leave_all(departures))
+        self.watchdogs.add(task)
+        task.add_done_callback(self.watchdogs.discard)
 
-                async for line in r.aiter_lines():
-                    if not line or not line.startswith("data:"):
-                        continue
+    async def leave_all(self, departures):
+        for message_id, done in departures:
+            await self.leave(message_id, done)
 
-                    payload = line.removeprefix("data:").strip()
+    async def leave(self, message_id, done):
+        viewers = await remove_viewer(message_id)
+        if not done and viewers <= 0 and CANCEL_ON_DISCONNECT:
+            watchdog = asyncio.create_task(self.cancel_if_abandoned(message_id))
+            self.watchdogs.add(watchdog)
+            watchdog.add_done_callback(self.watchdogs.discard)
 
-                    if payload == "[DONE]":
-                        break
+    async def cancel_if_abandoned(self, message_id):
+        await asyncio.sleep(DISCONNECT_GRACE_SECONDS)
+        if await count_viewers(message_id) <= 0:
+            await self.request_cancel(message_id)
 
-                    token_data = json.loads(payload)
-                    delta_obj = token_data["choices"][0].get("delta", {}) or {}
-                    delta = delta_obj.get("content", "")
+    async def request_cancel(self, message_id):
+        # The generation may belong to another API process; the channel
+        # reaches whichever one runs it.
+        if not self.cancel_local(message_id):
+            await redis_client.publish(GENERATION_CANCEL_CHANNEL, str(message_id))
 
-                    if delta:
-                        assistant_reply += delta
-                        yield f"data: {json.dumps({'token': delta})}\n\n"
+    def cancel_local(self, message_id) -> bool:
+        task = self.generations.get(message_id)
+        if task is None:
+            return False
+        self.cancel_requested.add(message_id)
+        task.cancel()
+        return True
 
-                if assistant_reply:
-                    await self.chat_service.add_assistant_message(
-                        chat_id, assistant_reply
+    async def listen_for_cancellations(self):
+        pubsub = redis_client.pubsub()
+        try:
+            while True:
+                try:
+                    if not pubsub.subscribed:
+                        await pubsub.subscribe(GENERATION_CANCEL_CHANNEL)
+                    message = await pubsub.get_message(
+                        ignore_subscribe_messages=True, timeout=None
                     )
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    await pubsub.reset()
+                    await asyncio.sleep(1)
+                    continue
+
+                if message and message["type"] == "message":
+                    self.cancel_local(int(message["data"]))
+        finally:
+            await pubsub.aclose()
+
+    async def replay_stored(self, message):
+        # The stream has expired: serve the persisted reply in one go.
+        yield sse_frame({"token": message.content})
+        yield sse_frame({"done": message.status.value})
+
+    async def aclose(self):
+        for task in [*self.watchdogs, *self.generations.values()]:
+            task.cancel()
+        await asyncio.gather(*self.generations.values(), return_exceptions=True)
+        await self.upstream.aclose()
+
+    async def stream_vllm(
+        self, chat_id, replies, messages, coalesce_ms, coalesce_tokens, route
+    ):
+        # Each reply is kept as a list of chunks and appended to its row in
+        # batches, so an aborted stream still leaves what was generated.
+        # Deltas are likewise coalesced into one stream entry per
+        # `coalesce_ms` / `coalesce_tokens`; the first token is never held.
+        started = time.monotonic()
+        branches = [_Branch(reply, started) for reply in replies]
+        first_token = True
+        stopped = asyncio.Event()
+        flusher = None
+        usage = {}
+        status = MessageStatus.partial
+        payload = {
+            "model": MODEL,
+            "messages": messages,
+            "stream": True,
+            "max_tokens": REPLY_TOKEN_RESERVE,
+            "stream_options": {"include_usage": True},
+        }
+        if len(branches) > 1:
+            # One request for all the alternatives: the prompt is prefilled
+            # once and its KV cache shared by every sequence.
+            payload["n"] = len(branches)
+        with span("generation", route=route, model=MODEL, branches=len(branches)):
+            try:
+                coalesce_interval = coalesce_ms / 1000
+                if coalesce_interval or coalesce_tokens:
+                    flusher = asyncio.create_task(
+                        _flush_stalled(
+                            branches, coalesce_interval or STREAM_STALL_FLUSH, stopped
+                        )
+                    )
+                async with self.upstream.stream(
+                    payload, affinity_key=chat_id, route=route
+                ) as r:
+                    async for index, delta in iter_choice_deltas(r, usage):
+                        if index >= len(branches):
+                            continue
+                        branch = branches[index]
+                        now = time.monotonic()
+                        if first_token:
+                            TIME_TO_FIRST_TOKEN_SECONDS.labels(
+                                route=route, model=MODEL
+                            ).observe(now - started)
+                            first_token = False
+                        elif branch.generated:
+                            INTER_TOKEN_SECONDS.labels(
+                                route=route, model=MODEL
+                            ).observe(now - branch.last_token)
+                        branch.last_token = now
+
+                        branch.generated += 1
+                        branch.pending.append(delta)
+                        branch.buffered.append(delta)
+
+                        if branch.publish_due(now, coalesce_interval, coalesce_tokens):
+                            await branch.publish()
 
-                await self.update_memory(chat_id)
+                        if (
+                            len(branch.pending) >= STREAM_FLUSH_TOKENS
+                            or now - branch.last_flush >= STREAM_FLUSH_INTERVAL
+                        ):
+                            with timed(
+                                DB_WRITE_SECONDS,
+                                "db_write",
+                                route=route,
+                                model=MODEL,
+                                operation="append",
+                            ):
+                                await self.chat_service.append_content(
+                                    branch.reply.id, "".join(branch.pending)
+                                )
+                            branch.pending.clear()
+                            branch.last_flush = now
 
-    async def update_memory(self, chat_id):
-        history = await self.load_history(chat_id)
-        if len(history) > WINDOW_SIZE:
-            self.summary = await self.summarize_history(history)
+                status = MessageStatus.complete
+            except asyncio.CancelledError:
+                # Leaving the upstream context closed the connection, which is
+                # what makes vLLM abort the sequences.
+                if any(reply.id in self.cancel_requested for reply in replies):
+                    status = MessageStatus.cancelled
+                raise
+            except Exception:
+                logger.exception("generation %s failed", replies[0].id)
+            finally:
+                # Stopped rather than cancelled, so it never drops a chunk
+                # it has taken out of a buffer.
+                stopped.set()
+                if flusher is not None:
+                    await asyncio.gather(flusher, return_exceptions=True)
+                # The usage chunk only comes at the end of a finished stream,
+                # and covers all choices together; counted deltas stand in
+                # for it otherwise.
+                total_tokens = usage.get("completion_tokens")
+                if total_tokens is None:
+                    total_tokens = sum(branch.generated for branch in branches)
+                for branch in branches:
+                    reply_id = branch.reply.id
+                    await branch.publish()
+                    with timed(
+                        DB_WRITE_SECONDS,
+                        "db_write",
+                        route=route,
+                        model=MODEL,
+                        operation="finish",
+                    ):
+                        await self.chat_service.finish_turn(
+                            chat_id,
+                            reply_id,
+                            "".join(branch.pending),
+                            status,
+                            total_tokens if len(branches) == 1 else branch.generated,
+                        )
+                    await close_stream(reply_id, status.value)
+                labels = {"route": route, "model": MODEL, "status": status.value}
+                STREAM_DURATION_SECONDS.labels(**labels).observe(
+                    time.monotonic() - started
+                )
+                COMPLETION_TOKENS_TOTAL.labels(**labels).inc(total_tokens)
+                # The last alternative is the one a turn without parent_id
+                # continues, see get_latest_message.
+                await enqueue_summary(chat_id, branches[-1].reply.id)
@@ -1,47 +1,383 @@
-from sqlalchemy import select
+from sqlalchemy import func, literal_column, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from libs.db import AsyncSessionLocal
-from libs.models import Chats, Messages, SenderRole
+from libs.cache import invalidate_history, push_history
+from libs.db import AsyncSessionLocal, ReadSessionLocal
+from libs.models import BranchSummaries, Chats, Messages, MessageStatus, SenderRole
+
+
+CONTENT_PREVIEW_LENGTH = 500
+# Must match the configuration of the messages.search_vector column.
+SEARCH_CONFIG = "english"
+SEARCH_HEADLINE_OPTIONS = (
+    "MaxFragments=2, MinWords=5, MaxWords=20, StartSel=<mark>, StopSel=</mark>"
+)
+
+CHAT_COLUMNS = (
+    Chats.id,
+    Chats.user_id,
+    Chats.title,
+    Chats.summary,
+    Chats.summarized_until_id,
+    Chats.created_at,
+    Chats.updated_at,
+)
+MESSAGE_PREVIEW_COLUMNS = (
+    Messages.id,
+    Messages.chat_id,
+    Messages.parent_id,
+    Messages.depth,
+    Messages.sender,
+    Messages.content_preview,
+    Messages.images,
+    Messages.status,
+    Messages.created_at,
+)
 
 
 class ChatService:
-    async def get_or_create_chat(self, user_id: int = 1):
-        async with AsyncSessionLocal() as db:
-            result = await db.execute(
-                select(Chats).where(Chats.user_id == user_id, Chats.is_deleted == False)
+    """Chat persistence. Every method runs on a caller-provided session so a
+    whole chat turn can share one connection checkout and one commit; use
+    `unit_of_work()` to open it."""
+
+    def unit_of_work(self) -> AsyncSession:
+        return AsyncSessionLocal()
+
+    def read_only(self) -> AsyncSession:
+        """Session on the read replica (the primary if none is configured)."""
+        return ReadSessionLocal()
+
+    async def get_or_create_chat(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        chat_id: int | None = None,
+        new_chat: bool = False,
+    ):
+        chat = None
+        if not new_chat:
+            query = select(Chats).where(
+                Chats.user_id == user_id, Chats.is_deleted == False
             )
+            if chat_id is not None:
+                query = query.where(Chats.id == chat_id)
+            else:
+                query = query.order_by(Chats.updated_at.desc()).limit(1)
+
+            result = await db.execute(query)
             chat = result.scalar_one_or_none()
 
-            if not chat:
-                chat = Chats(user_id=user_id, title=None)
-                db.add(chat)
-                await db.commit()
-                await db.refresh(chat)
+        if not chat:
+            if chat_id is not None:
+                return None
+            chat = Chats(user_id=user_id, title=None)
+            db.add(chat)
+            await db.flush()
 
-            return chat
+        return chat
 
-    async def add_user_message(self, chat_id: int, content: str):
-        async with AsyncSessionLocal() as db:
-            msg = Messages(chat_id=chat_id, sender=SenderRole.user, content=content)
-            db.add(msg)
-            await db.commit()
+    async def get_user_message(self, db: AsyncSession, user_id: int, message_id: int):
+        result = await db.execute(
+            select(
+                Messages.id,
+                Messages.chat_id,
+                Messages.path,
+                Messages.depth,
+                Messages.status,
+            )
+            .join(Chats, Chats.id == Messages.chat_id)
+            .where(
+                Messages.id == message_id,
+                Messages.is_deleted == False,
+                Chats.user_id == user_id,
+                Chats.is_deleted == False,
+            )
+        )
+        return result.one_or_none()
+
+    async def get_latest_message(self, db: AsyncSession, chat_id: int):
+        result = await db.execute(
+            select(Messages.id, Messages.chat_id, Messages.path, Messages.depth)
+            .where(Messages.chat_id == chat_id, Messages.is_deleted == False)
+            .order_by(Messages.created_at.desc(), Messages.id.desc())
+            .limit(1)
+        )
+        return result.one_or_none()
+
+    async def get_branch_summary(self, db: AsyncSession, tip):
+        """(message_id, summary) of the deepest summary on the branch ending
+        at `tip`, or None."""
+        if tip is None:
+            return None
+        # Ids grow down a branch, so the highest one is the deepest.
+        result = await db.execute(
+            select(BranchSummaries.message_id, BranchSummaries.summary)
+            .where(BranchSummaries.message_id.in_([*tip.path, tip.id]))
+            .order_by(BranchSummaries.message_id.desc())
+            .limit(1)
+        )
+        return result.one_or_none()
+
+    def add_message(
+        self,
+        db: AsyncSession,
+        chat_id: int,
+        user_id: int,
+        sender: SenderRole,
+        content: str,
+        parent,
+        status: MessageStatus = MessageStatus.complete,
+        images=(),
+    ):
+        msg = Messages(
+            chat_id=chat_id,
+            user_id=user_id,
+            sender=sender,
+            content=content,
+            content_preview=content[:CONTENT_PREVIEW_LENGTH],
+            images=list(images),
+            status=status,
+            parent_id=parent.id if parent else None,
+            path=[*parent.path, parent.id] if parent else [],
+            depth=parent.depth + 1 if parent else 0,
+        )
+        db.add(msg)
+        return msg
+
+    async def add_user_message(
+        self,
+        db: AsyncSession,
+        chat_id: int,
+        user_id: int,
+        content: str,
+        parent=None,
+        images=(),
+    ):
+        # Flushed with the turn's commit; the id is needed before streaming.
+        msg = self.add_message(
+            db, chat_id, user_id, SenderRole.user, content, parent, images=images
+        )
+        await db.flush()
+        return msg
 
-    async def add_assistant_message(self, chat_id: int, content: str):
-        async with AsyncSessionLocal() as db:
-            msg = Messages(
-                chat_id=chat_id, sender=SenderRole.assistant, content=content
+    async def commit_turn(self, db: AsyncSession, chat_id: int, user_message):
+        # The reply is cached by finish_turn, once its content is final.
+        await db.commit()
+        await push_history(chat_id, user_message)
+
+    async def start_assistant_messages(
+        self, db: AsyncSession, chat_id: int, user_id: int, parent, count: int = 1
+    ):
+        # Alternatives are siblings: every one answers the same user message.
+        messages = [
+            self.add_message(
+                db,
+                chat_id,
+                user_id,
+                SenderRole.assistant,
+                "",
+                parent,
+                MessageStatus.in_progress,
+            )
+            for _ in range(count)
+        ]
+        await db.flush()
+        return messages
+
+    async def append_content(self, message_id: int, chunk: str):
+        # Append server-side so each flush only ships the new tokens.
+        async with self.unit_of_work() as db:
+            await db.execute(
+                update(Messages)
+                .where(Messages.id == message_id)
+                .values(content=Messages.content + chunk)
             )
-            db.add(msg)
             await db.commit()
 
-    async def get_recent_messages(self, chat_id: int, window: int):
-        async with AsyncSessionLocal() as db:
+    async def finish_turn(
+        self,
+        chat_id: int,
+        message_id: int,
+        chunk: str,
+        status: MessageStatus,
+        completion_tokens: int,
+    ):
+        async with self.unit_of_work() as db:
             result = await db.execute(
-                select(Messages)
-                .where(Messages.chat_id == chat_id, Messages.is_deleted == False)
-                .order_by(Messages.created_at.desc())
-                .limit(window)
-            )
-            msgs = list(result.scalars().all())
-            msgs.reverse()
-            return msgs
+                update(Messages)
+                .where(Messages.id == message_id)
+                .values(
+                    content=Messages.content + chunk,
+                    content_preview=func.left(
+                        Messages.content + chunk, CONTENT_PREVIEW_LENGTH
+                    ),
+                    status=status,
+                    completion_tokens=completion_tokens,
+                )
+                .returning(
+                    Messages.id,
+                    Messages.parent_id,
+                    Messages.sender,
+                    Messages.content,
+                    Messages.images,
+                )
+            )
+            message = result.one()
+            await db.execute(
+                update(Chats).where(Chats.id == chat_id).values(updated_at=func.now())
+            )
+            await db.commit()
+        await push_history(chat_id, message)
+
+    async def get_message(self, db: AsyncSession, message_id: int):
+        return await db.get(Messages, message_id)
+
+    async def get_messages_by_ids(self, db: AsyncSession, ids: list[int]):
+        result = await db.execute(
+            select(
+                Messages.id,
+                Messages.parent_id,
+                Messages.sender,
+                Messages.content,
+                Messages.images,
+                Messages.status,
+                Messages.depth,
+            )
+            .where(Messages.id.in_(ids), Messages.is_deleted == False)
+            .order_by(Messages.depth.desc())
+        )
+        return list(result.all())
+
+    async def list_chats(
+        self, db: AsyncSession, user_id: int, limit: int, after: tuple | None
+    ):
+        # Keyset pagination: each page starts right after the previous
+        # page's last (updated_at, id), so page N costs the same as page 1.
+        query = select(*CHAT_COLUMNS).where(
+            Chats.user_id == user_id, Chats.is_deleted == False
+        )
+        if after is not None:
+            query = query.where(tuple_(Chats.updated_at, Chats.id) < after)
+        result = await db.execute(
+            query.order_by(Chats.updated_at.desc(), Chats.id.desc()).limit(limit)
+        )
+        return list(result.all())
+
+    async def list_messages(
+        self, db: AsyncSession, chat_id: int, limit: int, before: tuple | None
+    ):
+        # Newest first, for scroll-back; full content is fetched per message.
+        query = select(*MESSAGE_PREVIEW_COLUMNS).where(
+            Messages.chat_id == chat_id, Messages.is_deleted == False
+        )
+        if before is not None:
+            query = query.where(tuple_(Messages.created_at, Messages.id) < before)
+        result = await db.execute(
+            query.order_by(Messages.created_at.desc(), Messages.id.desc()).limit(
+                limit
+            )
+        )
+        return list(result.all())
+
+    async def search_messages(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        text: str,
+        limit: int,
+        after: tuple | None,
+    ):
+        config = literal_column(f"'{SEARCH_CONFIG}'::regconfig")
+        query = func.websearch_to_tsquery(config, text)
+        rank = func.ts_rank(Messages.search_vector, query)
+
+        # Matching and ranking run off the (user_id, search_vector) GIN index,
+        # so only this user's matches are read; the page is cut before
+        # ts_headline, which re-parses content, so it only runs per hit shown.
+        hits = (
+            select(Messages.id, rank.label("rank"))
+            .join(Chats, Chats.id == Messages.chat_id)
+            .where(
+                Messages.user_id == user_id,
+                Messages.search_vector.op("@@")(query),
+                Chats.is_deleted == False,
+                Messages.is_deleted == False,
+            )
+            .order_by(rank.desc(), Messages.id.desc())
+            .limit(limit)
+        )
+        if after is not None:
+            hits = hits.where(tuple_(rank, Messages.id) < after)
+        hits = hits.subquery()
+
+        result = await db.execute(
+            select(
+                Messages.id,
+                Messages.chat_id,
+                Messages.sender,
+                Messages.created_at,
+                hits.c.rank,
+                func.ts_headline(
+                    config, Messages.content, query, SEARCH_HEADLINE_OPTIONS
+                ).label("snippet"),
+            )
+            .join(hits, hits.c.id == Messages.id)
+            .order_by(hits.c.rank.desc(), Messages.id.desc())
+        )
+        return list(result.all())
+
+    async def get_user_messages(self, db: AsyncSession, user_id: int, ids: list[int]):
+        result = await db.execute(
+            select(Messages.id, Messages.sender, Messages.content, Messages.created_at)
+            .join(Chats, Chats.id == Messages.chat_id)
+            .where(
+                Messages.id.in_(ids),
+                Messages.is_deleted == False,
+                Chats.user_id == user_id,
+                Chats.is_deleted == False,
+            )
+            .order_by(Messages.created_at)
+        )
+        return list(result.all())
+
+    async def get_branch(self, db: AsyncSession, tip_id: int):
+        # The tip's path is unnested in a subquery, so the whole branch is a
+        # single primary-key lookup regardless of how large the chat is.
+        ancestors = select(func.unnest(Messages.path)).where(Messages.id == tip_id)
+        result = await db.execute(
+            select(Messages)
+            .where(
+                (Messages.id == tip_id) | Messages.id.in_(ancestors),
+                Messages.is_deleted == False,
+            )
+            .order_by(Messages.depth)
+        )
+        return list(result.scalars().all())
+
+    async def delete_chat(self, db: AsyncSession, user_id: int, chat_id: int):
+        result = await db.execute(
+            update(Chats)
+            .where(
+                Chats.id == chat_id,
+                Chats.user_id == user_id,
+                Chats.is_deleted == False,
+            )
+            .values(is_deleted=True)
+        )
+        await db.commit()
+        await invalidate_history(chat_id)
+        return result.rowcount > 0
+
+    async def delete_message(self, db: AsyncSession, message):
+        # Soft-deletes the message and every reply below it; the cached
+        # history of its chat is dropped so it cannot serve them any more.
+        await db.execute(
+            update(Messages)
+            .where(
+                Messages.chat_id == message.chat_id,
+                (Messages.id == message.id) | Messages.path.any(message.id),
+            )
+            .values(is_deleted=True)
+        )
+        await db.commit()
+        await invalidate_history(message.chat_id)
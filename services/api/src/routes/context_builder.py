@@ -0,0 +1,134 @@
+import logging
+import os
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+from libs.cache import load_history, rebuild_history
+from libs.llm import count_message_tokens
+from libs.memory import MEMORY_ENABLED, recall
+from libs.media import image_note
+from libs.models import MessageStatus
+from libs.telemetry import HISTORY_CACHE_REQUESTS, span
+from services.api.src.routes.chat_service import ChatService
+
+load_dotenv()
+
+MAX_MODEL_LEN = int(os.getenv("MAX_MODEL_LEN", "8192"))
+REPLY_TOKEN_RESERVE = int(os.getenv("REPLY_TOKEN_RESERVE", "1024"))
+CONTEXT_TOKEN_BUDGET = int(
+    os.getenv("CONTEXT_TOKEN_BUDGET", str(MAX_MODEL_LEN - REPLY_TOKEN_RESERVE))
+)
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "16"))
+MEMORY_SNIPPET_CHARS = int(os.getenv("MEMORY_SNIPPET_CHARS", "400"))
+
+logger = logging.getLogger(__name__)
+
+
+class ContextBuilder:
+    def __init__(self, chat_service: ChatService):
+        self.chat_service = chat_service
+
+    async def recall(self, db, user_id, summarized_until, tip, text):
+        """System message with the user's older messages closest to `text`,
+        or None. Branch messages past the branch summary (`summarized_until`)
+        are skipped, as the history window already carries them."""
+        if not MEMORY_ENABLED or not text.strip():
+            return None
+
+        exclude = (
+            {i for i in [*tip.path, tip.id] if i > summarized_until} if tip else set()
+        )
+        # Memory only enriches the prompt: a broken index must not fail the
+        # turn.
+        try:
+            with span("memory_recall"):
+                hits = await recall(user_id, text, exclude=exclude)
+        except Exception:
+            logger.exception("memory recall failed for user %s", user_id)
+            return None
+        if not hits:
+            return None
+
+        rows = await self.chat_service.get_user_messages(
+            db, user_id, [message_id for _, message_id, _ in hits]
+        )
+        if not rows:
+            return None
+        lines = [
+            f"- ({row.created_at:%Y-%m-%d}, {row.sender.value}) "
+            f"{row.content[:MEMORY_SNIPPET_CHARS]}"
+            for row in rows
+        ]
+        return "### RECALL\nEarlier messages that may be relevant:\n" + "\n".join(
+            lines
+        )
+
+    async def build(self, db, tip, system_messages, user_message):
+        limit = min(CONTEXT_TOKEN_BUDGET, MAX_MODEL_LEN - REPLY_TOKEN_RESERVE)
+        budget = limit
+        budget -= sum(count_message_tokens(m) for m in system_messages)
+        budget -= count_message_tokens(user_message)
+        if budget < 0:
+            raise HTTPException(413, "Message too long for the model context")
+
+        # Walk the branch from the tip towards the root until the budget runs
+        # out: first through the chat's cached recent history, then one page
+        # of ancestor ids at a time from the database.
+        ancestor_ids = [*tip.path, tip.id][::-1] if tip else []
+        cached = await load_history(tip.chat_id) if tip else None
+        history = []
+        full = False
+
+        hits = 0
+        for message_id in ancestor_ids if cached else []:
+            entry = cached.get(message_id)
+            if entry is None:
+                break
+            message = {
+                "role": entry["role"],
+                "content": entry["content"] + image_note(entry["images"]),
+            }
+            cost = count_message_tokens(message)
+            if cost > budget:
+                full = True
+                break
+            budget -= cost
+            history.append(message)
+            hits += 1
+
+        loaded = []
+        remaining = [] if full else ancestor_ids[hits:]
+        for start in range(0, len(remaining), HISTORY_PAGE_SIZE):
+            page = remaining[start : start + HISTORY_PAGE_SIZE]
+            rows = await self.chat_service.get_messages_by_ids(db, page)
+            loaded.extend(rows)
+            for row in rows:
+                message = {
+                    "role": row.sender.value,
+                    "content": row.content + image_note(row.images),
+                }
+                cost = count_message_tokens(message)
+                if cost > budget:
+                    full = True
+                    break
+                budget -= cost
+                history.append(message)
+            if full:
+                break
+
+        if tip:
+            if cached is None:
+                HISTORY_CACHE_REQUESTS.labels(result="miss").inc()
+                # Replies still streaming are cached by finish_turn instead.
+                await rebuild_history(
+                    tip.chat_id,
+                    [r for r in loaded if r.status != MessageStatus.in_progress],
+                )
+            else:
+                HISTORY_CACHE_REQUESTS.labels(
+                    result="partial" if loaded else "hit"
+                ).inc()
+
+        history.reverse()
+        return [*system_messages, *history, user_message], limit - budget
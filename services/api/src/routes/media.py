@@ -0,0 +1,58 @@
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import FileResponse
+
+from libs.media import (
+    IMAGE_VARIANT_SIZES,
+    UPLOAD_MAX_BYTES,
+    InvalidImage,
+    UploadTooLarge,
+    image_meta,
+    is_image_hash,
+    media_path,
+    store_image,
+)
+from ..deps import get_current_user
+
+router = APIRouter()
+
+
+@router.post("/upload")
+async def upload(request: Request, user=Depends(get_current_user)):
+    # The image is the raw request body, read as a stream, so nothing larger
+    # than one write buffer is ever held in memory.
+    length = request.headers.get("content-length")
+    if length is not None:
+        if not length.isdigit():
+            raise HTTPException(400, "Invalid Content-Length")
+        if int(length) > UPLOAD_MAX_BYTES:
+            raise HTTPException(413, "Image too large")
+
+    try:
+        return await store_image(request.stream())
+    except UploadTooLarge:
+        raise HTTPException(413, "Image too large")
+    except InvalidImage:
+        raise HTTPException(415, "Unsupported or corrupt image")
+
+
+@router.get("/{digest}")
+async def image(digest: str, size: int | None = None):
+    if size is not None and size not in IMAGE_VARIANT_SIZES:
+        raise HTTPException(400, "Unknown image size")
+
+    meta = image_meta(digest) if is_image_hash(digest) else None
+    if meta is None:
+        raise HTTPException(404, "Image not found")
+
+    path = media_path(digest, size)
+    if not os.path.exists(path):
+        raise HTTPException(404, "Image not found")
+
+    # Content-addressed, so a URL's bytes never change.
+    return FileResponse(
+        path,
+        media_type="image/jpeg" if size else meta["content_type"],
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
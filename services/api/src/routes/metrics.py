@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from libs.auth.hashing import hashing_stats
+
+from .chat import engine
+
+router = APIRouter()
+
+
+@router.get("")
+async def prometheus():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@router.get("/scheduler")
+async def scheduler():
+    return {
+        "admission": engine.admission.stats(),
+        "generations": len(engine.generations),
+        "hashing": hashing_stats(),
+        "upstreams": engine.upstream.stats(),
+    }
@@ -0,0 +1,32 @@
+import base64
+import datetime
+
+import orjson
+from fastapi import HTTPException
+
+DEFAULT_PAGE_SIZE = 30
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(*values) -> str:
+    """Opaque keyset cursor: the sort key of the last row on a page."""
+    return base64.urlsafe_b64encode(orjson.dumps(values)).decode()
+
+
+def decode_cursor(cursor: str, *types) -> tuple:
+    try:
+        values = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return tuple(
+            datetime.datetime.fromisoformat(v) if t is datetime.datetime else t(v)
+            for t, v in zip(types, values, strict=True)
+        )
+    except (ValueError, TypeError):
+        raise HTTPException(400, "Invalid cursor")
+
+
+def page(rows: list, limit: int, key) -> tuple[list, str | None]:
+    """Split off the look-ahead row fetched with `limit + 1`."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(*key(rows[-1]))
@@ -1,5 +1,180 @@
+import asyncio
+import logging
+import os
+
+from dotenv import load_dotenv
+from prometheus_client import start_http_server
+from sqlalchemy import or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from libs.db import AsyncSessionLocal
+from libs.jobs import claim_due_summaries, enqueue_summary
+from libs.llm import (
+    BACKGROUND,
+    MODEL,
+    AdmissionController,
+    AdmissionRejected,
+    UpstreamPool,
+    create_upstream_client,
+    summarize_history,
+)
+from libs.models import BranchSummaries, Chats, Messages, MessageStatus
+from libs.telemetry import SUMMARY_SECONDS, setup_tracing, timed, track_admission
+from services.worker.maintenance import maintenance_loop
+from services.worker.memory import index_memory
+
+load_dotenv()
+
+SUMMARY_BATCH_SIZE = int(os.getenv("SUMMARY_BATCH_SIZE", "20"))
+SUMMARY_POLL_INTERVAL = float(os.getenv("SUMMARY_POLL_INTERVAL", "1"))
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+SUMMARY_MAX_WAIT = float(os.getenv("SUMMARY_MAX_WAIT", "300"))
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "0"))
+
+# Summaries are background work: they get their own, smaller share of the
+# upstream and queue per user so one busy account cannot hog it.
+admission = AdmissionController(
+    max_concurrency=SUMMARY_CONCURRENCY, max_wait=SUMMARY_MAX_WAIT
+)
+track_admission(admission)
+
+logger = logging.getLogger("worker")
+
+
+async def summarize_branch(upstream: UpstreamPool, chat_id: int, tip_id: int):
+    """Extend the summary of the branch ending at `tip_id`.
+
+    Only that branch's messages (the tip's `path`) are read, starting after
+    its deepest summarized message, so neither an abandoned continuation nor
+    a sibling alternative leaks into it.
+    """
+    async with AsyncSessionLocal() as db:
+        chat = await db.get(Chats, chat_id)
+        if chat is None or chat.is_deleted:
+            return
+        tip = (
+            await db.execute(
+                select(Messages.path).where(
+                    Messages.id == tip_id, Messages.chat_id == chat_id
+                )
+            )
+        ).one_or_none()
+        if tip is None:
+            return
+        branch = [*tip.path, tip_id]
+
+        # Ids grow down a branch, so the highest one is the deepest.
+        base = (
+            await db.execute(
+                select(BranchSummaries.message_id, BranchSummaries.summary)
+                .where(BranchSummaries.message_id.in_(branch))
+                .order_by(BranchSummaries.message_id.desc())
+                .limit(1)
+            )
+        ).one_or_none()
+        start = branch.index(base.message_id) + 1 if base else 0
+        pending = branch[start : start + SUMMARY_BATCH_SIZE]
+        if not pending:
+            return
+
+        result = await db.execute(
+            select(
+                Messages.id, Messages.sender, Messages.content, Messages.status
+            ).where(Messages.id.in_(pending), Messages.is_deleted == False)
+        )
+        rows = {row.id: row for row in result.all()}
+        previous_summary = base.summary if base else None
+        user_id = chat.user_id
+
+    # Stop before a reply that is still streaming; the summary must not move
+    # past it or it would never be summarized. Deleted messages are covered
+    # but left out.
+    history, until = [], None
+    for message_id in pending:
+        row = rows.get(message_id)
+        if row is not None:
+            if row.status == MessageStatus.in_progress:
+                break
+            history.append({"role": row.sender.value, "content": row.content})
+        until = message_id
+    if until is None:
+        return
+    has_more = until == pending[-1] and start + len(pending) < len(branch)
+
+    if history:
+        async with admission.slot(user_id, BACKGROUND):
+            with timed(SUMMARY_SECONDS, "summary", model=MODEL):
+                summary = await summarize_history(
+                    upstream, previous_summary, history, affinity_key=chat_id
+                )
+    else:
+        summary = previous_summary or ""
+
+    async with AsyncSessionLocal() as db:
+        # Keyed by the last message covered: a concurrent run over the same
+        # messages writes the same row, and the first one wins.
+        await db.execute(
+            insert(BranchSummaries)
+            .values(message_id=until, chat_id=chat_id, summary=summary)
+            .on_conflict_do_nothing()
+        )
+        # The chat keeps the newest branch summary for listings and exports.
+        await db.execute(
+            update(Chats)
+            .where(
+                Chats.id == chat_id,
+                or_(
+                    Chats.summarized_until_id.is_(None),
+                    Chats.summarized_until_id < until,
+                ),
+            )
+            .values(summary=summary, summarized_until_id=until)
+        )
+        await db.commit()
+
+    if has_more:
+        await enqueue_summary(chat_id, tip_id)
+
+
+async def run_job(upstream: UpstreamPool, chat_id: int, tip_id: int):
+    try:
+        await summarize_branch(upstream, chat_id, tip_id)
+    except AdmissionRejected:
+        await enqueue_summary(chat_id, tip_id)
+    except Exception:
+        logger.exception("summary failed for chat %s", chat_id)
+
+    # The same debounced job keeps the owner's long-term memory current.
+    try:
+        await index_memory(chat_id)
+    except Exception:
+        logger.exception("memory indexing failed for chat %s", chat_id)
+
+
+async def run():
+    upstream = UpstreamPool(create_upstream_client())
+    upstream.start()
+    maintenance = asyncio.create_task(maintenance_loop())
+    try:
+        while True:
+            jobs = await claim_due_summaries()
+            await asyncio.gather(
+                *(run_job(upstream, chat_id, tip_id) for chat_id, tip_id in jobs)
+            )
+
+            if not jobs:
+                await asyncio.sleep(SUMMARY_POLL_INTERVAL)
+    finally:
+        maintenance.cancel()
+        await upstream.aclose()
+
+
 def main():
-    print("Hello from worker!")
+    logging.basicConfig(level=logging.INFO)
+    setup_tracing("chat-worker")
+    if WORKER_METRICS_PORT:
+        start_http_server(WORKER_METRICS_PORT)
+    asyncio.run(run())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,227 @@
+import asyncio
+import datetime
+import logging
+import os
+import re
+
+import orjson
+from dotenv import load_dotenv
+from sqlalchemy import and_, delete, exists, or_, select, text, update
+
+from libs.cache import close_stream, stream_exists
+from libs.db import AsyncSessionLocal
+from libs.jobs import enqueue_summary
+from libs.models import BranchSummaries, Chats, Messages, MessageStatus, Users
+
+load_dotenv()
+
+COMPACTION_INTERVAL = float(os.getenv("COMPACTION_INTERVAL", "3600"))
+COMPACTION_BATCH_SIZE = int(os.getenv("COMPACTION_BATCH_SIZE", "500"))
+# Pause between batches so compaction never competes with live traffic.
+COMPACTION_PAUSE = float(os.getenv("COMPACTION_PAUSE", "0.1"))
+# When set, purged rows are appended here as NDJSON before they are deleted.
+COMPACTION_ARCHIVE_DIR = os.getenv("COMPACTION_ARCHIVE_DIR", "")
+MESSAGE_PARTITION_ROWS = int(os.getenv("MESSAGE_PARTITION_ROWS", "10000000"))
+MESSAGE_PARTITIONS_AHEAD = int(os.getenv("MESSAGE_PARTITIONS_AHEAD", "2"))
+# A reply still `in_progress` after this long lost its generation to a
+# crash or restart of the API process that ran it.
+STALE_GENERATION_SECONDS = float(os.getenv("STALE_GENERATION_SECONDS", "900"))
+
+logger = logging.getLogger("worker.maintenance")
+
+_UPPER_BOUND = re.compile(r"TO \('?(-?\d+)'?\)")
+
+
+def _archive(table: str, rows):
+    path = os.path.join(
+        COMPACTION_ARCHIVE_DIR, f"{table}-{datetime.date.today():%Y%m%d}.ndjson"
+    )
+    with open(path, "ab") as f:
+        for row in rows:
+            f.write(orjson.dumps(dict(row._mapping), option=orjson.OPT_APPEND_NEWLINE))
+
+
+async def _purge_batch(table, condition) -> int:
+    # Each batch is its own short transaction. SKIP LOCKED leaves rows that
+    # a request is touching for the next run instead of waiting on them.
+    async with AsyncSessionLocal() as db:
+        ids = (
+            select(table.id)
+            .where(condition)
+            .order_by(table.id)
+            .limit(COMPACTION_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        )
+        statement = delete(table).where(table.id.in_(ids))
+        if COMPACTION_ARCHIVE_DIR:
+            statement = statement.returning(*table.__table__.c)
+            rows = (await db.execute(statement)).all()
+            await asyncio.to_thread(_archive, table.__tablename__, rows)
+            purged = [row.id for row in rows]
+        else:
+            statement = statement.returning(table.id)
+            purged = list((await db.execute(statement)).scalars())
+
+        if table is Messages and purged:
+            await db.execute(
+                update(Messages)
+                .where(Messages.parent_id.in_(purged))
+                .values(parent_id=None)
+            )
+            await db.execute(
+                delete(BranchSummaries).where(BranchSummaries.message_id.in_(purged))
+            )
+        await db.commit()
+    return len(purged)
+
+
+async def _purge(table, condition) -> int:
+    total = 0
+    while True:
+        purged = await _purge_batch(table, condition)
+        total += purged
+        if purged < COMPACTION_BATCH_SIZE:
+            return total
+        await asyncio.sleep(COMPACTION_PAUSE)
+
+
+async def compact():
+    """Hard-delete soft-deleted users, chats and messages.
+
+    Children go first and parents only once they are empty, so no delete
+    ever cascades into a large, long-locking batch.
+    """
+    chat_gone = or_(
+        Chats.is_deleted == True,
+        exists().where(Users.id == Chats.user_id, Users.is_deleted == True),
+    )
+    messages = await _purge(
+        Messages,
+        or_(
+            Messages.is_deleted == True,
+            exists().where(Chats.id == Messages.chat_id, chat_gone),
+        ),
+    )
+    chats = await _purge(
+        Chats, and_(chat_gone, ~exists().where(Messages.chat_id == Chats.id))
+    )
+    users = await _purge(
+        Users,
+        and_(Users.is_deleted == True, ~exists().where(Chats.user_id == Users.id)),
+    )
+    if messages or chats or users:
+        logger.info(
+            "compaction purged %s messages, %s chats, %s users",
+            messages,
+            chats,
+            users,
+        )
+
+
+async def recover_stale_generations():
+    """Mark orphaned `in_progress` replies as `partial`.
+
+    Summaries and memory indexing stop at a reply that is still streaming,
+    so an orphan would hold back its chat's watermark for good.
+    """
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        seconds=STALE_GENERATION_SECONDS
+    )
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            update(Messages)
+            .where(
+                Messages.status == MessageStatus.in_progress,
+                Messages.created_at < cutoff,
+            )
+            .values(status=MessageStatus.partial)
+            .returning(Messages.id, Messages.chat_id)
+        )
+        rows = result.all()
+        await db.commit()
+
+    for row in rows:
+        # Viewers still following the stream get their `done`.
+        if await stream_exists(row.id):
+            await close_stream(row.id, MessageStatus.partial.value)
+    tips = {row.chat_id: row.id for row in sorted(rows, key=lambda row: row.id)}
+    for chat_id, tip_id in tips.items():
+        await enqueue_summary(chat_id, tip_id)
+    if rows:
+        logger.info("marked %s stale generations as partial", len(rows))
+
+
+async def _create_message_partition(start: int, end: int):
+    name = f"messages_id_{start}"
+    columns = ", ".join(c.name for c in Messages.__table__.c if c.computed is None)
+    async with AsyncSessionLocal() as db:
+        # Ids past the last range land in the default partition (the worker
+        # was down, or an import ran ahead), and a new range overlapping
+        # them could not be created. They are moved over before it is
+        # attached, in the same transaction.
+        await db.execute(
+            text(
+                f"CREATE TABLE {name} "
+                f"(LIKE messages INCLUDING DEFAULTS INCLUDING GENERATED)"
+            )
+        )
+        await db.execute(
+            text(
+                f"WITH moved AS (DELETE FROM messages_default "
+                f"WHERE id >= {start} AND id < {end} RETURNING {columns}) "
+                f"INSERT INTO {name} ({columns}) SELECT {columns} FROM moved"
+            )
+        )
+        await db.execute(
+            text(
+                f"ALTER TABLE messages ATTACH PARTITION {name} "
+                f"FOR VALUES FROM ({start}) TO ({end})"
+            )
+        )
+        await db.commit()
+
+
+async def ensure_message_partitions():
+    """Keep MESSAGE_PARTITIONS_AHEAD id ranges ready past the id sequence."""
+    async with AsyncSessionLocal() as db:
+        partitioned = await db.scalar(
+            text("SELECT relkind = 'p' FROM pg_class WHERE relname = 'messages'")
+        )
+        if not partitioned:
+            return
+
+        bounds = await db.scalars(
+            text(
+                "SELECT pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = 'messages'::regclass"
+            )
+        )
+        uppers = [int(m.group(1)) for m in map(_UPPER_BOUND.search, bounds) if m]
+        last_id = await db.scalar(text("SELECT last_value FROM messages_id_seq"))
+
+    upper = max(uppers)
+    while upper <= last_id + MESSAGE_PARTITIONS_AHEAD * MESSAGE_PARTITION_ROWS:
+        await _create_message_partition(upper, upper + MESSAGE_PARTITION_ROWS)
+        logger.info("created messages partition from id %s", upper)
+        upper += MESSAGE_PARTITION_ROWS
+
+
+async def maintenance_loop():
+    if COMPACTION_ARCHIVE_DIR:
+        os.makedirs(COMPACTION_ARCHIVE_DIR, exist_ok=True)
+    while True:
+        try:
+            await recover_stale_generations()
+        except Exception:
+            logger.exception("stale generation sweep failed")
+        # Independent steps: one failing must not stop the others.
+        try:
+            await ensure_message_partitions()
+        except Exception:
+            logger.exception("message partitioning failed")
+        try:
+            await compact()
+        except Exception:
+            logger.exception("compaction failed")
+        await asyncio.sleep(COMPACTION_INTERVAL)
@@ -0,0 +1,85 @@
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy import func, literal_column, select
+
+from libs.db import AsyncSessionLocal
+from libs.memory import (
+    MEMORY_ENABLED,
+    memory_indexed_since,
+    memory_watermark,
+    remember,
+)
+from libs.models import Chats, Messages, MessageStatus
+
+load_dotenv()
+
+MEMORY_INDEX_BATCH = int(os.getenv("MEMORY_INDEX_BATCH", "256"))
+
+# A row is settled once the transaction that wrote it is older than every
+# transaction still running: no id below it can still commit after it.
+_SETTLED = func.age(literal_column("messages.xmin")) > func.age(
+    literal_column("pg_snapshot_xmin(pg_current_snapshot())::xid")
+)
+
+
+async def index_memory(chat_id: int):
+    """Bring the long-term memory of the chat's owner up to date.
+
+    Indexing runs per user over all their chats, in id order from the
+    index's watermark. Ids are handed out before their transactions commit,
+    so a lower id can appear after a higher one was indexed: the watermark
+    only moves past settled rows, and rows above it that are already
+    indexed are skipped. Replies still streaming are skipped too and picked
+    up by the job their finish enqueues.
+    """
+    if not MEMORY_ENABLED:
+        return
+
+    async with AsyncSessionLocal() as db:
+        user_id = await db.scalar(select(Chats.user_id).where(Chats.id == chat_id))
+    if user_id is None:
+        return
+
+    watermark = memory_watermark(user_id)
+    indexed = memory_indexed_since(user_id, watermark)
+    after = watermark
+    settled = True
+    while True:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(
+                    Messages.id,
+                    Messages.chat_id,
+                    Messages.content,
+                    Messages.status,
+                    _SETTLED.label("settled"),
+                )
+                .join(Chats, Chats.id == Messages.chat_id)
+                .where(
+                    Messages.user_id == user_id,
+                    Chats.is_deleted == False,
+                    Messages.is_deleted == False,
+                    Messages.id > after,
+                )
+                .order_by(Messages.id)
+                .limit(MEMORY_INDEX_BATCH)
+            )
+            rows = list(result.all())
+        if not rows:
+            return
+
+        start, batch = watermark, []
+        for row in rows:
+            finished = row.status != MessageStatus.in_progress
+            settled = settled and finished and row.settled
+            if settled:
+                watermark = row.id
+            if finished and row.id not in indexed:
+                batch.append(row)
+
+        if batch or watermark != start:
+            await remember(user_id, [r for r in batch if r.content], watermark)
+        if len(rows) < MEMORY_INDEX_BATCH:
+            return
+        after = rows[-1].id